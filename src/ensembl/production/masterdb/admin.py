@@ -11,17 +11,27 @@
 #   limitations under the License.
 # TODO add uncheck all is_current when checking is_current
 
+import re
+
 from django.contrib import admin
 from django.contrib import messages
-from django.http import HttpResponse
+from django.core.exceptions import FieldDoesNotExist, PermissionDenied
+from django.db import models
+from django.http import Http404, JsonResponse
+from django.urls import path
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
-import csv
 from ensembl.production.djcore.admin import ProductionUserAdminMixin
 from ensembl.production.djcore.utils import flatten
 
-from .filters import IsCurrentFilter, DBTypeFilter, BioTypeFilter, TargetSiteFilter
+from .export import stream_export
+from .fields import json_digest
+from .filters import IsCurrentFilter, DBTypeFilter, BioTypeFilter, TargetSiteFilter, FacetListFilter, facet_limit
 from .forms import AnalysisDescriptionForm, MetaKeyForm, WebDataForm
+from .paginator import EstimatedCountPaginator, EstimatedCountChangeList
+from . import cache, search
 from .models import *
+from .usage import usage_of
 
 
 class ProductionModelAdmin(ProductionUserAdminMixin):
@@ -29,8 +39,10 @@ class ProductionModelAdmin(ProductionUserAdminMixin):
     readonly_fields = ['created_by', 'created_at', 'modified_by', 'modified_at']
     ordering = ('-modified_at', '-created_at')
     list_filter = ['created_by', 'modified_by']
+    paginator = EstimatedCountPaginator
     # ability to define a list of 'only_super_admin' fields
     super_user_only = []
+    actions = ['export_as_csv', 'export_as_tsv', 'export_as_ndjson']
 
     def get_readonly_fields(self, request, obj=None):
         readonly_fields = super().get_readonly_fields(request, obj)
@@ -52,16 +64,77 @@ class ProductionModelAdmin(ProductionUserAdminMixin):
     def has_change_permission(self, request, obj=None):
         return request.user.is_staff
 
+    def get_changelist(self, request, **kwargs):
+        return EstimatedCountChangeList
+
+    def get_list_filter(self, request):
+        """
+        Plain value fields filters listed from cached facets (see `FacetListFilter`).
+        """
+        list_filter = []
+        for list_filter_item in super().get_list_filter(request):
+            if isinstance(list_filter_item, str) and self.is_facet(list_filter_item):
+                list_filter_item = (list_filter_item, FacetListFilter)
+            list_filter.append(list_filter_item)
+        return list_filter
+
+    def is_facet(self, field_name):
+        try:
+            field = self.model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            return False
+        return not (field.is_relation or isinstance(field, models.BooleanField))
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path('facets/<str:field_name>/', self.admin_site.admin_view(self.facets_view),
+                 name='%s_%s_facets' % (opts.app_label, opts.model_name)),
+        ] + super().get_urls()
+
+    def facets_view(self, request, field_name):
+        """
+        Type-ahead lookup of a lazy facet values: most used ones containing `term`, with their rows count.
+        """
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        if (field_name, FacetListFilter) not in self.get_list_filter(request):
+            raise Http404
+        term = request.GET.get('term', '').lower()
+        rows = cache.facets(self.model, field_name).rows
+        results = [{'value': row['value'], 'count': row['count']} for row in rows
+                   if row['value'] is not None and term in str(row['value']).lower()][:facet_limit()]
+        return JsonResponse({'results': results})
+
     def get_list_display(self, request):
         list_display = super().get_list_display(request)
         if issubclass(self.model, BaseTimestampedModel):
             list_display = list_display + ('modified_at',)
         return list_display
 
+    def export_as_csv(self, request, queryset):
+        return stream_export(self, request, queryset, 'csv')
+
+    export_as_csv.short_description = "Export selected %(verbose_name_plural)s as CSV"
+
+    def export_as_tsv(self, request, queryset):
+        return stream_export(self, request, queryset, 'tsv')
+
+    export_as_tsv.short_description = "Export selected %(verbose_name_plural)s as TSV"
+
+    def export_as_ndjson(self, request, queryset):
+        return stream_export(self, request, queryset, 'ndjson')
+
+    export_as_ndjson.short_description = "Export selected %(verbose_name_plural)s as NDJSON"
+
 
 class ProductionTabularInline(admin.TabularInline):
     readonly_fields = ['modified_by', 'created_by', 'created_at', 'modified_at']
 
+    def get_queryset(self, request):
+        # users displayed on every row
+        return super().get_queryset(request).select_related('created_by', 'modified_by')
+
 
 class AttribInline(ProductionTabularInline):
     model = MasterAttrib
@@ -89,13 +162,77 @@ class AnalysisDescriptionInline(ProductionTabularInline):
         return False
 
 
+DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+class WebDataDigestSearchMixin:
+    """
+    Search terms being a JSON document are matched against indexed web data digest, whatever keys order, as are
+    search terms being a digest.
+    """
+    web_data_digest_lookup = 'data_digest'
+
+    def get_search_results(self, request, queryset, search_term):
+        if DIGEST.match(search_term.strip()):
+            return queryset.filter(**{self.web_data_digest_lookup: search_term.strip()}), False
+        try:
+            data = json.loads(search_term)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            return queryset.filter(**{self.web_data_digest_lookup: json_digest(data)}), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+class FullTextSearchMixin:
+    """
+    Search terms matched as word prefixes against the model full-text index (see `search`), instead of one
+    `icontains` scan per search field.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term.strip() and search.is_searchable(self.model):
+            results = search.search(queryset, search_term, ranked=False)
+            if results is not None:
+                return results, False
+        return super().get_search_results(request, queryset, search_term)
+
+
 class HasCurrentAdmin(ProductionModelAdmin):
     list_filter = ProductionModelAdmin.list_filter + [IsCurrentFilter, ]
 
 
+class UsageAdminMixin:
+    """
+    Show databases using edited row on change form, from usage index (see `index_usage` command).
+    """
+    usage_limit = 20
+
+    def get_readonly_fields(self, request, obj=None):
+        return list(super().get_readonly_fields(request, obj)) + ['usage']
+
+    def get_fieldsets(self, request, obj=None):
+        fieldsets = super().get_fieldsets(request, obj)
+        if obj is None:
+            return fieldsets
+        return fieldsets + (("Usage", {"fields": ('usage',)}),)
+
+    def usage(self, obj):
+        counts = list(usage_of(obj))
+        if not counts:
+            return 'Not used in indexed databases'
+        rows = format_html_join('', '<tr><td>{}</td><td>{}</td></tr>',
+                                ((count.database.name, count.count) for count in counts[:self.usage_limit]))
+        return format_html('{} database(s), {} row(s)<table>{}</table>{}', len(counts),
+                           sum(count.count for count in counts), rows,
+                           '...' if len(counts) > self.usage_limit else '')
+
+    usage.short_description = "Used in"
+
+
 # Register your models here.
 @admin.register(MasterAttribType)
-class AttribTypeAdmin(HasCurrentAdmin):
+class AttribTypeAdmin(UsageAdminMixin, HasCurrentAdmin):
     list_display = ('code', 'name', 'description', 'is_current')
     search_fields = ('code', 'name', 'description')
     inlines = (AttribInline,)
@@ -121,6 +258,7 @@ class AttribTypeAdmin(HasCurrentAdmin):
 @admin.register(MasterAttrib)
 class AttribAdmin(HasCurrentAdmin):
     list_display = ('value', 'attrib_type', 'is_current', 'attrib_id',)
+    list_select_related = ('attrib_type',)
     search_fields = ('attrib_id', 'value', 'attrib_type__name')
     fieldsets = (
         ("General", {"fields": ('value', 'attrib_type')}),
@@ -131,6 +269,7 @@ class AttribAdmin(HasCurrentAdmin):
 @admin.register(MasterAttribSet)
 class AttribSetAdmin(HasCurrentAdmin):
     list_display = ('attrib', 'is_current', 'attrib_set_id')
+    list_select_related = ('attrib',)
     search_fields = ('attrib__value', 'attrib_set_id')
     ordering = ('-modified_at',)
     list_filter = ['attrib_set_id', 'attrib'] + HasCurrentAdmin.list_filter
@@ -141,7 +280,7 @@ class AttribSetAdmin(HasCurrentAdmin):
 
 
 @admin.register(MasterBiotype)
-class BioTypeAdmin(HasCurrentAdmin):
+class BioTypeAdmin(FullTextSearchMixin, UsageAdminMixin, HasCurrentAdmin):
     class Media:
         css = {
             'all': ('production_db/css/prod_db.css',)
@@ -155,32 +294,21 @@ class BioTypeAdmin(HasCurrentAdmin):
     list_display = (
         'name', 'object_type', 'db_type', 'biotype_group', 'attrib_type', 'description', 'is_current', 'so_acc',
         'so_term')
+    list_select_related = ('attrib_type',)
     search_fields = (
         'name', 'object_type', 'db_type', 'biotype_group', 'attrib_type__name', 'description', 'so_acc', 'so_term')
 
-    list_filter = ['name', 'object_type'] + [DBTypeFilter] + ['biotype_group', 'so_acc',
+    list_filter = ['name', 'object_type'] + [BioTypeFilter] + ['biotype_group', 'so_acc',
                                                               'so_term'] + HasCurrentAdmin.list_filter
 
-    def export_as_csv(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="biotypes.csv"'
-        field_names = super().get_list_display(request)
-        writer = csv.writer(response)
-        writer.writerow(field_names)
-        for obj in queryset:
-            writer.writerow([getattr(obj, field) for field in field_names])
-        return response
-
-    export_as_csv.short_description = "Export Selected Biotype as CSV"
-
-    actions = ['export_as_csv']
-
 
 @admin.register(AnalysisDescription)
-class AnalysisDescriptionAdmin(HasCurrentAdmin):
+class AnalysisDescriptionAdmin(WebDataDigestSearchMixin, FullTextSearchMixin, HasCurrentAdmin):
     form = AnalysisDescriptionForm
     list_display = ('logic_name', 'short_description', 'web_data_label', 'is_current', 'displayable')
-    search_fields = ('logic_name', 'display_label', 'description', 'web_data__data')
+    search_fields = ('logic_name', 'display_label', 'description', 'web_data__data', '=web_data__data_digest')
+    web_data_digest_lookup = 'web_data__data_digest'
+    list_select_related = ('web_data',)
     list_filter = ['displayable'] + HasCurrentAdmin.list_filter
     fieldsets = (
         ("General", {"fields": ('logic_name', 'description', 'display_label', 'web_data', 'web_data_label')}),
@@ -239,7 +367,7 @@ class MetakeyAdmin(HasCurrentAdmin):
 
 
 @admin.register(WebData)
-class WebDataAdmin(ProductionModelAdmin):
+class WebDataAdmin(WebDataDigestSearchMixin, ProductionModelAdmin):
     class Media:
         css = {
             'all': ('admin/production_db/css/prod_db.css',)
@@ -247,8 +375,9 @@ class WebDataAdmin(ProductionModelAdmin):
 
     form = WebDataForm
     list_display = ('pk', 'data', 'comment', 'modified_by')
+    list_select_related = ('modified_by',)
     list_editable = ('comment', 'data')
-    search_fields = ('pk', 'data', 'comment')
+    search_fields = ('pk', '=data_digest', 'data', 'comment')
 
     inlines = (AnalysisDescriptionInline,)
     fieldsets = (
@@ -264,7 +393,7 @@ class WebDataAdmin(ProductionModelAdmin):
 
 
 @admin.register(MasterExternalDb)
-class MasterExternalDbAdmin(HasCurrentAdmin):
+class MasterExternalDbAdmin(FullTextSearchMixin, UsageAdminMixin, HasCurrentAdmin):
     list_display = ('db_name', 'db_release', 'status', 'db_display_name', 'priority', 'type', 'secondary_db_name',
                     'secondary_db_table', 'is_current')
     search_fields = (
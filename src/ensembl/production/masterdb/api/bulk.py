@@ -0,0 +1,233 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from django.contrib.auth import get_user_model
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+
+from ensembl.production.masterdb.api.parsers import NDJSONParser
+from ensembl.production.masterdb.models import is_unique_violation
+
+User = get_user_model()
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+ERROR = 'error'
+
+
+def chunks(values, size):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def sent_values(data, row):
+    """
+    Validated `data` restricted to the fields sent in `row`, nested objects included, so that fields a row omits
+    keep their stored value on update (and get their model default on create) instead of the serializer default.
+    """
+    values = {}
+    for name, value in data.items():
+        if name not in row:
+            continue
+        if isinstance(value, dict) and isinstance(row[name], dict):
+            value = sent_values(value, row[name])
+        values[name] = value
+    return values
+
+
+def as_list(value):
+    if isinstance(value, str):
+        return value.split(',') if value else []
+    return list(value or [])
+
+
+class BulkUpsertMixin:
+    """
+    Add a `bulk` list route to a ModelViewSet, accepting a JSON array or NDJSON body of objects.
+    Rows are validated with the viewset serializer, users and foreign keys are resolved once for the
+    whole batch, then rows are created / updated against their natural key (`bulk_key`) in one transaction.
+    Response is a per-row report: created / updated / unchanged / error.
+    """
+    #: model fields identifying a row (natural key)
+    bulk_key = ()
+    #: foreign keys to load along with existing rows
+    bulk_select_related = ()
+    bulk_batch_size = 500
+    #: batch attempts when a concurrent writer inserted one of its keys meanwhile
+    bulk_retries = 3
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request, *args, **kwargs):
+        rows = request.data
+        if not isinstance(rows, list):
+            raise ParseError('Expected a JSON array or NDJSON list of objects')
+        report = self.bulk_upsert(rows)
+        return Response(report)
+
+    @property
+    def bulk_model(self):
+        return self.get_serializer_class().Meta.model
+
+    def get_bulk_context(self, rows):
+        """
+        Build serializer context shared by all batch rows: users and related rows are fetched once.
+        """
+        context = dict(self.get_serializer_context(), bulk=True, prefetched={})
+        usernames = {row['user'] for row in rows if isinstance(row, dict) and row.get('user')}
+        context['users'] = {user.username: user for user in
+                            User.objects.filter(username__in=usernames, is_staff=True)} if usernames else {}
+        probe = self.get_serializer_class()(context=context)
+        for name, field in probe.fields.items():
+            if not isinstance(field, serializers.PrimaryKeyRelatedField) or field.read_only:
+                continue
+            values = set()
+            for row in rows:
+                try:
+                    values.add(int(row[name]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+            model = field.get_queryset().model
+            context['prefetched'][model] = field.get_queryset().in_bulk(values) if values else {}
+        return context
+
+    def bulk_prepare(self, rows):
+        """
+        Hook to resolve nested relations for the whole batch, `rows` being a list of validated data.
+        """
+        pass
+
+    def bulk_updated(self, updated):
+        """
+        Hook called after write, in the same transaction, with the list of updated instances (see
+        `TrackedFieldsMixin.changed_fields` to list their changes).
+        """
+        pass
+
+    def row_key(self, data):
+        return tuple(getattr(data.get(name), 'pk', data.get(name)) for name in self.bulk_key)
+
+    def instance_key(self, obj):
+        return tuple(getattr(obj, self.bulk_model._meta.get_field(name).attname) for name in self.bulk_key)
+
+    def bulk_existing(self, keys):
+        """
+        Fetch stored rows matching `keys`, filtering on the first key field then matching the full key.
+        """
+        existing = {}
+        queryset = self.bulk_model._default_manager.select_related(*self.bulk_select_related)
+        first = self.bulk_key[0]
+        for chunk in chunks({key[0] for key in keys}, self.bulk_batch_size):
+            for obj in queryset.filter(**{'%s__in' % first: chunk}):
+                existing[self.instance_key(obj)] = obj
+        return {key: obj for key, obj in existing.items() if key in keys}
+
+    def differs(self, obj, name, value):
+        field = obj._meta.get_field(name)
+        current = getattr(obj, field.attname)
+        if field.is_relation:
+            value = getattr(value, 'pk', value)
+        if isinstance(current, list) or isinstance(value, list):
+            # MultiSelectField values, either as list or comma separated string
+            return sorted(as_list(current)) != sorted(as_list(value))
+        if current in (None, '') and value in (None, ''):
+            return False
+        return current != value
+
+    def bulk_write(self, valid, report):
+        """
+        Match validated rows against stored ones, then bulk insert / update them.
+        :param valid: list of (index, validated data)
+        :param report: per-row report to fill in
+        :return: list of updated instances
+        """
+        keyed = {}
+        for index, data in valid:
+            key = self.row_key(data)
+            report[index]['key'] = dict(zip(self.bulk_key, key))
+            if key in keyed:
+                report[index].update(status=ERROR, errors='Duplicated key in batch (row %s)' % keyed[key][0])
+                continue
+            keyed[key] = (index, data)
+        existing = self.bulk_existing(set(keyed.keys())) if keyed else {}
+
+        now = timezone.now()
+        to_create, to_update, update_fields = [], [], {'modified_by', 'modified_at'}
+        for key, (index, data) in keyed.items():
+            user = data.pop('user', None)
+            obj = existing.get(key)
+            if obj is None:
+                obj = self.bulk_model(**data)
+                if user is not None:
+                    obj.created_by = user
+                to_create.append(obj)
+                report[index]['status'] = CREATED
+                continue
+            changed = [name for name, value in data.items() if self.differs(obj, name, value)]
+            if not changed:
+                report[index]['status'] = UNCHANGED
+                continue
+            for name in changed:
+                setattr(obj, name, data[name])
+            if user is not None:
+                obj.modified_by = user
+            obj.modified_at = now
+            update_fields.update(changed)
+            to_update.append(obj)
+            report[index]['status'] = UPDATED
+
+        if to_create:
+            self.bulk_model._default_manager.bulk_create(to_create, batch_size=self.bulk_batch_size)
+        if to_update:
+            self.bulk_model._default_manager.bulk_update(to_update, fields=sorted(update_fields),
+                                                         batch_size=self.bulk_batch_size)
+        return to_update
+
+    def bulk_upsert(self, rows):
+        """
+        Validate then upsert `rows`, returning the batch report.
+        """
+        # one serializer validates every row, as a ListSerializer child does: fields are built only once
+        serializer = self.get_serializer_class()(context=self.get_bulk_context(rows))
+        report = [{'index': index} for index in range(len(rows))]
+        valid = []
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                report[index].update(status=ERROR, errors='Expected an object')
+                continue
+            try:
+                valid.append((index, sent_values(serializer.run_validation(row), row)))
+            except APIException as exc:
+                report[index].update(status=ERROR, errors=exc.detail)
+        for attempt in range(self.bulk_retries):
+            # hooks alter rows, each attempt works on copies
+            batch = [(index, dict(data)) for index, data in valid]
+            try:
+                with transaction.atomic():
+                    self.bulk_prepare([data for index, data in batch])
+                    updated = self.bulk_write(batch, report)
+                    self.bulk_updated(updated)
+                break
+            except IntegrityError as e:
+                # a concurrent writer inserted some keys since they were read: next attempt updates them
+                if attempt + 1 == self.bulk_retries or not is_unique_violation(e):
+                    raise
+        summary = {status: 0 for status in (CREATED, UPDATED, UNCHANGED, ERROR)}
+        for row in report:
+            summary[row['status']] += 1
+        return dict(summary, rows=report)
@@ -0,0 +1,65 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import hashlib
+
+from django.utils.cache import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from ensembl.production.masterdb.models import TableVersion
+
+
+class NotModified(Exception):
+    pass
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETag on list and detail GET, computed from the version counters of the tables a viewset representation
+    depends on (`version_models`, default to serializer model), the full path and the accepted media type.
+    A matching `If-None-Match` is answered with 304 Not Modified after a single query, before any queryset or
+    serializer is run.
+    """
+    version_models = ()
+    conditional_actions = ('list', 'retrieve')
+    etag = None
+    #: versions of `version_models` tables, when fetched for this request
+    versions = None
+
+    def get_version_models(self):
+        return self.version_models or (self.get_serializer_class().Meta.model,)
+
+    def get_etag(self, request):
+        versions = self.versions = TableVersion.objects.versions(*self.get_version_models())
+        key = '|'.join([request.get_full_path(), request.META.get('HTTP_ACCEPT', '')] +
+                       ['%s:%s' % version for version in versions])
+        return '"%s"' % hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = self.versions = None
+        if request.method in ('GET', 'HEAD') and self.action in self.conditional_actions:
+            self.etag = self.get_etag(request)
+            if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+            if self.etag in if_none_match or '*' in if_none_match:
+                raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': self.etag})
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag and response.status_code == status.HTTP_200_OK:
+            response['ETag'] = self.etag
+        return response
@@ -0,0 +1,181 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import datetime
+import re
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import BooleanField, DateTimeField, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from multiselectfield import MultiSelectField
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField as BooleanSerializerField
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import BaseSerializer
+
+from ensembl.production.masterdb import search
+from ensembl.production.masterdb.api.serializers import FIELDS_PARAM, OMIT_PARAM
+from ensembl.production.masterdb.models import db_type_query
+
+
+def multiselect_membership(field_name, values):
+    """
+    Exact membership on a MultiSelectField comma separated string: `core` doesn't match `coreexpressionatlas`.
+    """
+    query = Q()
+    for value in values:
+        query |= Q(**{'%s__regex' % field_name: r'(^|,)%s(,|$)' % re.escape(value)})
+    return query
+
+
+class MasterDBFilterBackend(BaseFilterBackend):
+    """
+    Query parameters filters pushed down to the ORM, declared per viewset in `query_filters`
+    as model lookups (e.g. `is_current`, `attrib_type__code`, `modified_at__gte`).
+    - boolean fields accept true/false/1/0
+    - MultiSelectField (db_type) accept a comma separated list of values, matching rows with any of them,
+      from indexed db_type membership when available
+    - other fields accept a comma separated list of values (IN)
+    Searchable models (see `search`) also accept `q`, rows matching all its words as prefixes, best matches first
+    unless paginated: cursor pagination orders on primary key, so paginated results are not ranked.
+    Columns loaded are restricted to the fields selected by `fields` / `omit` (see `serializers.SparseFieldsMixin`),
+    related rows only being joined when their nested representation is selected.
+    """
+    search_param = 'q'
+
+    def get_filters(self, view):
+        return getattr(view, 'query_filters', ())
+
+    def is_searchable(self, view):
+        return search.is_searchable(view.get_serializer_class().Meta.model)
+
+    def get_model_field(self, model, lookup):
+        parts = lookup.split('__')
+        if parts[-1] in ('gte', 'lte', 'gt', 'lt'):
+            parts = parts[:-1]
+        field = None
+        for part in parts:
+            field = model._meta.get_field(part)
+            model = field.related_model or model
+        return field
+
+    def filter_queryset(self, request, queryset, view):
+        for lookup in self.get_filters(view):
+            if lookup not in request.query_params:
+                continue
+            value = request.query_params[lookup]
+            try:
+                queryset = queryset.filter(self.build_query(queryset.model, lookup, value))
+            except (TypeError, ValueError):
+                raise ValidationError({lookup: 'Invalid value'})
+        search_term = request.query_params.get(self.search_param)
+        if search_term is not None and search.is_searchable(queryset.model):
+            paginator = getattr(view, 'paginator', None)
+            paginated = paginator is not None and (not hasattr(paginator, 'is_requested') or
+                                                   paginator.is_requested(request))
+            results = search.search(queryset, search_term, ranked=not paginated)
+            if results is None:
+                raise ValidationError({self.search_param: 'Expected at least one word to search'})
+            queryset = results
+        if request.method in SAFE_METHODS and (FIELDS_PARAM in request.query_params or
+                                               OMIT_PARAM in request.query_params):
+            queryset = self.select_columns(queryset, view.get_serializer())
+        return queryset
+
+    def select_columns(self, queryset, serializer):
+        """
+        Load only the columns `serializer` readable fields are read from, with the primary key.
+        """
+        opts = queryset.model._meta
+        columns = {opts.pk.name}
+        for field in serializer._readable_fields:
+            if field.source == '*':
+                return queryset
+            try:
+                model_field = opts.get_field(field.source_attrs[0])
+            except FieldDoesNotExist:
+                # not a model field, may read any column
+                return queryset
+            if model_field.concrete and not model_field.many_to_many:
+                columns.add(model_field.name)
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict):
+            queryset = queryset.select_related(None)
+            related = [name for name in select_related if name in columns]
+            if related:
+                queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+    def build_query(self, model, lookup, value):
+        try:
+            field = self.get_model_field(model, lookup)
+        except FieldDoesNotExist:
+            raise ValidationError({lookup: 'Unknown filter'})
+        if isinstance(field, BooleanField):
+            if value.lower() in BooleanSerializerField.TRUE_VALUES:
+                return Q(**{lookup: True})
+            if value.lower() in BooleanSerializerField.FALSE_VALUES:
+                return Q(**{lookup: False})
+            raise ValidationError({lookup: 'Expected a boolean value'})
+        if isinstance(field, DateTimeField):
+            parsed = parse_datetime(value)
+            if parsed is None:
+                date = parse_date(value)
+                if date is None:
+                    raise ValidationError({lookup: 'Expected an ISO 8601 date or datetime'})
+                parsed = datetime.datetime.combine(date, datetime.time.min)
+            if timezone.is_naive(parsed):
+                # dates and datetimes without offset are in current time zone
+                parsed = timezone.make_aware(parsed)
+            return Q(**{lookup: parsed})
+        values = [v.strip() for v in value.split(',') if v.strip()]
+        if isinstance(field, MultiSelectField):
+            if lookup == 'db_type' and hasattr(model, 'db_types'):
+                return db_type_query(model, values)
+            return multiselect_membership(lookup, values)
+        if len(values) == 1:
+            return Q(**{lookup: values[0]})
+        return Q(**{'%s__in' % lookup: values})
+
+    def get_schema_fields(self, view):
+        if coreapi is None:
+            return []
+        fields = [coreapi.Field(name=lookup, required=False, location='query',
+                                schema=coreschema.String(description='Filter on %s' % lookup))
+                  for lookup in self.get_filters(view)]
+        if self.is_searchable(view):
+            fields.append(coreapi.Field(name=self.search_param, required=False, location='query',
+                                        schema=coreschema.String(description='Full-text search')))
+        for name, description in self.get_fields_params(view):
+            fields.append(coreapi.Field(name=name, required=False, location='query',
+                                        schema=coreschema.String(description=description)))
+        return fields
+
+    def get_schema_operation_parameters(self, view):
+        parameters = [{'name': lookup, 'required': False, 'in': 'query',
+                       'description': 'Filter on %s' % lookup, 'schema': {'type': 'string'}}
+                      for lookup in self.get_filters(view)]
+        if self.is_searchable(view):
+            parameters.append({'name': self.search_param, 'required': False, 'in': 'query',
+                               'description': 'Full-text search', 'schema': {'type': 'string'}})
+        for name, description in self.get_fields_params(view):
+            parameters.append({'name': name, 'required': False, 'in': 'query',
+                               'description': description, 'schema': {'type': 'string'}})
+        return parameters
+
+    def get_fields_params(self, view):
+        names = ', '.join(name for name, field in view.get_serializer_class()().fields.items()
+                          if not field.write_only)
+        return [(FIELDS_PARAM, 'Comma separated fields to return, among: %s' % names),
+                (OMIT_PARAM, 'Comma separated fields not to return, among: %s' % names)]
@@ -0,0 +1,86 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+
+from ensembl.production.masterdb.api.bulk import chunks
+from ensembl.production.masterdb.cache import row_value
+
+
+class BatchLookupMixin:
+    """
+    Add a `lookup` list route resolving many rows by natural key (`snapshot_key`, default to lookup field) at once.
+    Body is a JSON array of keys: objects of the key fields (e.g. `{"name": "miRNA", "object_type": "gene"}`), or
+    plain values for single field keys. Rows come from the viewset snapshot when cached, from one IN query per
+    `lookup_batch_size` keys otherwise.
+    Response is `{"found": {...}, "not_found": [...]}`, rows being mapped by key, nested by key field for multiple
+    fields keys, keys not found being listed as sent.
+    """
+    lookup_batch_size = 500
+    lookup_max_keys = 10000
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser])
+    def lookup(self, request, *args, **kwargs):
+        key_fields = self.get_natural_key()
+        keys = self.parse_keys(request.data, key_fields)
+        rows = self.lookup_rows(keys, key_fields)
+        found, not_found = {}, []
+        for key in keys:
+            row = rows.get(key)
+            if row is None:
+                not_found.append(key[0] if len(key) == 1 else dict(zip(key_fields, key)))
+                continue
+            mapping = found
+            for value in key[:-1]:
+                mapping = mapping.setdefault(value, {})
+            mapping[key[-1]] = row
+        return Response({'found': found, 'not_found': not_found})
+
+    def get_natural_key(self):
+        return self.snapshot_key or (self.lookup_field,)
+
+    def parse_keys(self, data, key_fields):
+        """
+        Distinct keys of request body, as tuples of strings in `key_fields` order.
+        """
+        if not isinstance(data, list):
+            raise ParseError('Expected a JSON array of keys')
+        if len(data) > self.lookup_max_keys:
+            raise serializers.ValidationError('At most %s keys per lookup' % self.lookup_max_keys)
+        keys = {}
+        for index, item in enumerate(data):
+            if isinstance(item, dict):
+                values = [item.get(name) for name in key_fields]
+            else:
+                values = [item] if len(key_fields) == 1 else [None]
+            if any(isinstance(value, bool) or not isinstance(value, (str, int)) for value in values):
+                raise serializers.ValidationError({index: 'Expected %s' % ', '.join(key_fields)})
+            keys.setdefault(tuple(str(value) for value in values))
+        return list(keys)
+
+    def lookup_rows(self, keys, key_fields):
+        """
+        Serialized rows matching `keys`, by key.
+        """
+        snapshot = self.get_snapshot() if self.use_snapshot(self.request) else None
+        if snapshot is not None:
+            rows = {key: snapshot.get(*key) for key in keys}
+            return {key: row for key, row in rows.items() if row is not None}
+        rows = {}
+        queryset = self.filter_queryset(self.get_queryset())
+        for chunk in chunks({key[0] for key in keys}, self.lookup_batch_size):
+            for row in self.serialized_rows(queryset.filter(**{'%s__in' % key_fields[0]: chunk})):
+                rows.setdefault(tuple(str(row_value(row, name)) for name in key_fields), row)
+        return {key: rows[key] for key in keys if key in rows}
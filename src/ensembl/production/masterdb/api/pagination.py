@@ -0,0 +1,124 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import datetime
+from collections import OrderedDict
+
+from django.utils import timezone
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, CursorPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from ensembl.production.masterdb.journal import journal_delay
+
+
+class MasterDBCursorPagination(CursorPagination):
+    """
+    Keyset pagination on primary key: each page is a range scan on the primary key index, whatever the page depth.
+    Only enabled when `cursor` or `page_size` query parameter is set, plain list is returned otherwise.
+    """
+    ordering = 'pk'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def is_requested(self, request):
+        return self.cursor_query_param in request.query_params or self.page_size_query_param in request.query_params
+
+
+class SincePagination(BasePagination):
+    """
+    Keyset pagination on an increasing sequence: `since` is the last sequence number already read (0 to start),
+    the response `last` being the checkpoint to send with the next request.
+    Sequence numbers are assigned on insert but only visible on commit, so a row may show up after rows with higher
+    numbers were served: when `created_field` is set, rows created less than `get_delay()` seconds ago, and all rows
+    following them, are held back. No row is missed as long as transactions last less than this delay.
+    """
+    ordering = 'seq'
+    since_query_param = 'since'
+    page_size = 1000
+    page_size_query_param = 'page_size'
+    max_page_size = 10000
+    #: row creation datetime field
+    created_field = None
+    delay = 0
+
+    def get_delay(self):
+        return self.delay
+
+    def get_horizon(self, queryset):
+        """
+        Lowest sequence number held back, None if none.
+        """
+        if self.created_field is None:
+            return None
+        created_after = timezone.now() - datetime.timedelta(seconds=self.get_delay())
+        return queryset.filter(**{'%s__gte' % self.created_field: created_after}).order_by(
+            self.ordering).values_list(self.ordering, flat=True).first()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            self.since = int(request.query_params.get(self.since_query_param, 0))
+        except ValueError:
+            raise ValidationError({self.since_query_param: 'Expected a sequence number'})
+        try:
+            page_size = _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                      cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            page_size = self.page_size
+        queryset = queryset.filter(**{'%s__gt' % self.ordering: self.since})
+        horizon = self.get_horizon(queryset)
+        if horizon is not None:
+            queryset = queryset.filter(**{'%s__lt' % self.ordering: horizon})
+        rows = list(queryset.order_by(self.ordering)[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.last = getattr(rows[-1], self.ordering) if rows else self.since
+        self.request = request
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.since_query_param, self.last)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('since', self.since),
+            ('last', self.last),
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.since_query_param, 'required': False, 'in': 'query',
+             'description': 'Last sequence number already read', 'schema': {'type': 'integer'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': 'Number of results to return per page', 'schema': {'type': 'integer'}},
+        ]
+
+
+class ChangeJournalPagination(SincePagination):
+    """
+    Change journal entries, held back for `MASTER_DB_CHANGE_JOURNAL_DELAY` seconds.
+    """
+    created_field = 'created_at'
+
+    def get_delay(self):
+        return journal_delay()
@@ -0,0 +1,36 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renders a list as newline delimited JSON, one object per line, any other data as a single line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+    encoder_class = encoders.JSONEncoder
+
+    def dumps(self, value):
+        # same output as JSONRenderer, line and paragraph separators escaped for javascript
+        return json.dumps(value, cls=self.encoder_class, ensure_ascii=JSONRenderer.ensure_ascii,
+                          separators=(',', ':')).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, (list, tuple)) else [data]
+        return ''.join(self.dumps(row) + '\n' for row in rows).encode('utf-8')
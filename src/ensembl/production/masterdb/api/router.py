@@ -9,12 +9,13 @@
 #   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
-from rest_framework.routers import Route, SimpleRouter
+from rest_framework.routers import DynamicRoute, Route, SimpleRouter
 
 
 class MasterDBRestRouter(SimpleRouter):
     """
-    A router for read-only APIs, which doesn't use trailing slashes.
+    A router without trailing slashes, routing list GET / POST and extra list actions, such as POST `bulk` upserts
+    and `lookup` batches.
     """
     routes = [
         Route(
@@ -23,5 +24,12 @@ class MasterDBRestRouter(SimpleRouter):
             name='{basename}-list',
             detail=False,
             initkwargs={'suffix': 'List'}
-        )
+        ),
+        # Dynamically generated list routes, e.g. bulk upsert.
+        DynamicRoute(
+            url=r'^{prefix}/{url_path}$',
+            name='{basename}-{url_name}',
+            detail=False,
+            initkwargs={}
+        ),
     ]
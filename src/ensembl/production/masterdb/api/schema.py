@@ -0,0 +1,183 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+OpenAPI schema views, drf_yasg being imported on first hit only.
+Rendered schemas are kept in memory per package version, host, path and format, up to
+`MASTER_DB_API_SCHEMA_CACHE_SIZE` of them, served gzip compressed to clients accepting it. Schema artefacts built
+at deploy time by `build_api_schema` in `MASTER_DB_API_SCHEMA_DIR` are served instead when available for current
+package version.
+"""
+import functools
+import gzip
+import os
+import threading
+from collections import namedtuple
+from importlib import metadata
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import permissions
+
+CONTENT_TYPES = {
+    '.json': 'application/json; charset=utf-8',
+    '.yaml': 'application/yaml; charset=utf-8',
+}
+
+RenderedSchema = namedtuple('RenderedSchema', ('content', 'compressed', 'content_type'))
+
+_schemas = {}
+_lock = threading.Lock()
+
+
+def cache_size():
+    return getattr(settings, 'MASTER_DB_API_SCHEMA_CACHE_SIZE', 16)
+
+
+def cache_schema(key, schema):
+    """
+    Keep `schema`, oldest schemas being dropped beyond cache size. Lock must be held.
+    """
+    while _schemas and len(_schemas) >= cache_size():
+        del _schemas[next(iter(_schemas))]
+    _schemas[key] = schema
+    return schema
+
+
+def package_version():
+    try:
+        return metadata.version('ensembl-prodinf-masterdb')
+    except metadata.PackageNotFoundError:
+        return 'dev'
+
+
+def schema_info():
+    from drf_yasg import openapi
+    return openapi.Info(
+        title="Production DB API snippets",
+        default_version='v1',
+        description="Production DB Api Description",
+        contact=openapi.Contact(email="ensembl-production@ebi.ac.uk"),
+        license=openapi.License(name="Apache 2 License"),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def schema_view():
+    from drf_yasg.views import get_schema_view
+    return get_schema_view(schema_info(), public=True, permission_classes=(permissions.AllowAny,))
+
+
+@functools.lru_cache(maxsize=None)
+def spec_view():
+    return schema_view().without_ui(cache_timeout=0)
+
+
+@functools.lru_cache(maxsize=None)
+def redoc_view():
+    return schema_view().with_ui('redoc', cache_timeout=0)
+
+
+def generate_schema(format='.json', url=None):
+    """
+    Encoded schema of all API endpoints, `url` being the API public root (schema host), if any.
+    """
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    generator = schema_view().generator_class(schema_info(), url=url)
+    codec = OpenAPICodecJson if format == '.json' else OpenAPICodecYaml
+    return codec(validators=[]).encode(generator.get_schema(request=None, public=True))
+
+
+def artefact_path(format, directory=None):
+    directory = directory or getattr(settings, 'MASTER_DB_API_SCHEMA_DIR', None)
+    if not directory:
+        return None
+    return os.path.join(directory, 'swagger-%s%s.gz' % (package_version(), format))
+
+
+def write_artefact(format, directory, url=None):
+    path = artefact_path(format, directory)
+    with open(path, 'wb') as f:
+        f.write(gzip.compress(generate_schema(format, url)))
+    return path
+
+
+def read_artefact(format):
+    path = artefact_path(format)
+    if path is None:
+        return None
+    schema = _schemas.get(path)
+    if schema is None and os.path.exists(path):
+        with open(path, 'rb') as f:
+            compressed = f.read()
+        with _lock:
+            schema = cache_schema(path, RenderedSchema(gzip.decompress(compressed), compressed,
+                                                       CONTENT_TYPES[format]))
+    return schema
+
+
+def rendered_schema(request, view, *args, **kwargs):
+    """
+    Response of drf_yasg `view` to `request`, rendered once per package version, None when not successful.
+    The format (URL suffix or `format` query parameter) selects the renderer whatever the Accept header, other query
+    parameters don't change the schema: none are part of the cache key.
+    """
+    key = (package_version(), request.scheme, request.get_host(), request.path,
+           kwargs.get('format') or request.GET.get('format'))
+    schema = _schemas.get(key)
+    if schema is None:
+        with _lock:
+            schema = _schemas.get(key)
+            if schema is None:
+                response = view(request, *args, **kwargs)
+                response.render()
+                if response.status_code != 200:
+                    return None
+                schema = cache_schema(key, RenderedSchema(response.content, gzip.compress(response.content),
+                                                          response['Content-Type']))
+    return schema
+
+
+def schema_response(request, schema):
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(schema.compressed, content_type=schema.content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(schema.content, content_type=schema.content_type)
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
+
+
+def schema_json(request, format):
+    schema = read_artefact(format)
+    if schema is None:
+        schema = rendered_schema(request, spec_view(), format=format)
+    if schema is None:
+        # errors aren't cached
+        return spec_view()(request, format=format)
+    return schema_response(request, schema)
+
+
+def schema_redoc(request):
+    """
+    ReDoc page, the schema it loads (`?format=openapi`) being cached.
+    """
+    if 'format' not in request.GET:
+        return redoc_view()(request)
+    schema = rendered_schema(request, redoc_view())
+    if schema is None:
+        return redoc_view()(request)
+    return schema_response(request, schema)
+
+
+def clear():
+    _schemas.clear()
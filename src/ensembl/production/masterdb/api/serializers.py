@@ -11,22 +11,105 @@
 #   limitations under the License.
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction, IntegrityError
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework import status
 from rest_framework.exceptions import APIException
+from rest_framework.validators import UniqueValidator, UniqueTogetherValidator
 
+from ensembl.production.masterdb.fields import json_digest
+from ensembl.production.masterdb.instrumentation import timed
 from ensembl.production.masterdb.models import *
 
 User = get_user_model()
 
 
-class WebDataSerializer(serializers.ModelSerializer):
+class BatchPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key related field able to resolve its value from rows pre-fetched for a whole batch
+    (see `api.bulk`), falling back to the default one query per value otherwise.
+    """
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get('prefetched', {}).get(self.get_queryset().model)
+        if prefetched is None:
+            return super().to_internal_value(data)
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            return prefetched[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class TimedRepresentationMixin:
+    """
+    Serialization time reported by request instrumentation, nested serializers being part of their parent's.
+    """
+
+    def to_representation(self, instance):
+        with timed('serializer'):
+            return super().to_representation(instance)
+
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def sparse_field_names(query_params, names):
+    """
+    Names among `names` selected by `fields` query parameter, or all but `omit` ones (comma separated lists).
+    :return: selected names in `names` order, None when neither parameter is set
+    """
+    if FIELDS_PARAM not in query_params and OMIT_PARAM not in query_params:
+        return None
+    selected = set(names)
+    for param in (FIELDS_PARAM, OMIT_PARAM):
+        if param not in query_params:
+            continue
+        values = {value.strip() for value in query_params[param].split(',') if value.strip()}
+        unknown = values - set(names)
+        if unknown:
+            raise serializers.ValidationError({param: 'Unknown field(s): %s' % ', '.join(sorted(unknown))})
+        selected = selected & values if param == FIELDS_PARAM else selected - values
+    return [name for name in names if name in selected]
+
+
+class SparseFieldsMixin:
+    """
+    GET representation restricted to `fields` query parameter ones, or all but `omit` ones, at top level only:
+    nested serializers keep all their fields.
+    """
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS or not self.is_root():
+            return fields
+        selected = sparse_field_names(request.query_params,
+                                      [name for name, field in fields.items() if not field.write_only])
+        if selected is None:
+            return fields
+        return {name: fields[name] for name in selected}
+
+
+class WebDataSerializer(SparseFieldsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = WebData
-        exclude = ('created_at', 'modified_at')
+        exclude = ('created_at', 'modified_at', 'data_digest')
 
 
-class BaseUserTimestampSerializer(serializers.ModelSerializer):
+class BaseUserTimestampSerializer(SparseFieldsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
+    serializer_related_field = BatchPrimaryKeyRelatedField
     user = serializers.CharField(write_only=True, required=False)
 
     def create(self, validated_data):
@@ -39,15 +122,35 @@ class BaseUserTimestampSerializer(serializers.ModelSerializer):
             validated_data['modified_by'] = validated_data.pop('user')
         return super().update(instance, validated_data)
 
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get('bulk'):
+            # natural keys uniqueness is handled by the bulk upsert itself, not row by row
+            for field in fields.values():
+                field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+        return fields
+
+    def get_validators(self):
+        validators = super().get_validators()
+        if self.context.get('bulk'):
+            validators = [v for v in validators if not isinstance(v, UniqueTogetherValidator)]
+        return validators
+
+    def get_user(self, username):
+        users = self.context.get('users')
+        try:
+            if users is not None:
+                return users[username]
+            return User.objects.get(username=username, is_staff=True)
+        except (KeyError, ObjectDoesNotExist):
+            exc = APIException(code='error', detail="User not found")
+            # hack to update status code. :-(
+            exc.status_code = status.HTTP_400_BAD_REQUEST
+            raise exc
+
     def validate(self, data):
         if "user" in data:
-            try:
-                data['user'] = User.objects.get(username=data.pop('user', ''), is_staff=True)
-            except ObjectDoesNotExist:
-                exc = APIException(code='error', detail="User not found")
-                # hack to update status code. :-(
-                exc.status_code = status.HTTP_400_BAD_REQUEST
-                raise exc
+            data['user'] = self.get_user(data.pop('user', ''))
         data = super().validate(data)
         return data
 
@@ -68,7 +171,7 @@ class AttribTypeSerializerUser(BaseUserTimestampSerializer):
         exclude = ('created_at', 'modified_at')
 
 
-class AttribTypeSerializerNoValidator(serializers.ModelSerializer):
+class AttribTypeSerializerNoValidator(TimedRepresentationMixin, serializers.ModelSerializer):
     is_current = serializers.BooleanField(default=True, initial=True)
 
     class Meta:
@@ -92,15 +195,19 @@ class AttribSerializerUser(BaseUserTimestampSerializer):
 
     def create(self, validated_data):
         attrib_type = validated_data.pop('attrib_type')
-        elem = MasterAttribType.objects.filter(code=attrib_type.get('code')).first()
-        if not elem:
-            attrib_type['created_by'] = validated_data.get('user', None)
-            elem = MasterAttribType.objects.create(**attrib_type)
-        elif validated_data.get('user', None) is not None:
-            attrib_type['modified_by'] = validated_data.get('user')
-            elem = MasterAttribType.objects.update(**attrib_type)
-        validated_data['attrib_type'] = elem
-        return super(AttribSerializerUser, self).create(validated_data)
+        code = attrib_type.get('code')
+        with transaction.atomic():
+            validated_data['attrib_type'] = MasterAttribType.objects.upsert_codes(
+                {code: (attrib_type, validated_data.get('user', None))})[code]
+            try:
+                with transaction.atomic():
+                    return super(AttribSerializerUser, self).create(validated_data)
+            except IntegrityError as e:
+                if not is_unique_violation(e):
+                    raise
+                # inserted by a concurrent writer since validation
+                raise serializers.ValidationError(
+                    {'value': 'Attrib %s already exists for attrib type %s' % (validated_data.get('value'), code)})
 
 
 class AnalysisDescriptionSerializerUser(BaseUserTimestampSerializer):
@@ -124,7 +231,8 @@ class AnalysisDescriptionSerializerUser(BaseUserTimestampSerializer):
     @staticmethod
     def process_web_data(web_data_content, user):
         search_content = web_data_content.get('data', None)
-        elem = WebData.objects.filter(data=search_content).first()
+        digest = json_digest(search_content) if search_content is not None else None
+        elem = WebData.objects.filter(data_digest=digest).first()
         if not elem:
             web_data_content['created_by'] = user
             elem = WebData.objects.create(**web_data_content)
@@ -138,3 +246,18 @@ class AnalysisDescriptionSerializerUser(BaseUserTimestampSerializer):
             instance.web_data = self.process_web_data(validated_data.pop('web_data'),
                                                       validated_data.get('user', None))
         return super(AnalysisDescriptionSerializerUser, self).update(instance, validated_data)
+
+
+class ChangeJournalSerializer(SparseFieldsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ChangeJournal
+        fields = ('seq', 'model', 'natural_key', 'operation', 'row', 'created_at')
+
+
+class UsageCountSerializer(SparseFieldsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
+    database = serializers.CharField(source='database.name')
+    indexed_at = serializers.DateTimeField(source='database.indexed_at')
+
+    class Meta:
+        model = UsageCount
+        fields = ('model', 'key', 'database', 'count', 'indexed_at')
@@ -0,0 +1,60 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+from django.http import Http404
+from rest_framework.response import Response
+
+from ensembl.production.masterdb.cache import snapshots, cache_enabled, snapshot_max_rows
+
+
+class SnapshotReadMixin:
+    """
+    Serve list and detail GET without query parameters from an in-process snapshot of serialized rows
+    (see `cache.SnapshotCache`), rebuilt once one of the viewset `get_version_models()` tables changed.
+    Requests with filters or pagination parameters go to database, as do requests on tables above snapshot rows limit.
+    """
+    snapshot_enabled = True
+    #: natural key of serialized rows, default to lookup field
+    snapshot_key = ()
+
+    def use_snapshot(self, request):
+        return self.snapshot_enabled and cache_enabled() and not (set(request.query_params) - {'format'})
+
+    def get_snapshot(self, max_rows=snapshot_max_rows):
+        """
+        :param max_rows: rows above which no snapshot is built (see `SnapshotCache.get`)
+        :return: Snapshot, None when the table is too large to be kept in memory
+        """
+        return snapshots.get(self.__class__.__name__, self.get_version_models(),
+                             self.snapshot_rows,
+                             key=self.snapshot_key or (self.lookup_field,), versions=self.versions, max_rows=max_rows)
+
+    def snapshot_rows(self):
+        return self.get_serializer(self.get_queryset(), many=True).data
+
+    def list(self, request, *args, **kwargs):
+        snapshot = self.get_snapshot() if self.use_snapshot(request) else None
+        if snapshot is None:
+            return super().list(request, *args, **kwargs)
+        return Response(list(snapshot.rows))
+
+    def retrieve(self, request, *args, **kwargs):
+        snapshot = self.get_snapshot() if self.use_snapshot(request) else None
+        if snapshot is None:
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        rows = snapshot.filter(self.lookup_field, self.kwargs[lookup_url_kwarg])
+        if not rows:
+            raise Http404
+        if len(rows) > 1:
+            # lookup field is no unique key, keep default behaviour
+            return super().retrieve(request, *args, **kwargs)
+        return Response(rows[0])
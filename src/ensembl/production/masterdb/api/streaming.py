@@ -0,0 +1,76 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import itertools
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from ensembl.production.masterdb.api.renderers import NDJSONRenderer
+
+
+class StreamingListMixin:
+    """
+    Stream unpaginated list responses negotiated as JSON or NDJSON, rows being fetched by chunks with
+    `queryset.iterator()` and serialized one by one, so that memory use does not depend on the table size.
+    Lists up to `stream_chunk_size` rows are returned as a plain response.
+    Lists served from snapshots (see `SnapshotReadMixin`) stream their cached rows, tables above snapshot rows
+    limit being streamed from database.
+    """
+    stream_chunk_size = 100
+
+    def use_streaming(self, request):
+        paginator = self.paginator
+        if paginator is not None and (not hasattr(paginator, 'is_requested') or paginator.is_requested(request)):
+            return False
+        return isinstance(request.accepted_renderer, (JSONRenderer, NDJSONRenderer))
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_streaming(request):
+            return super().list(request, *args, **kwargs)
+        snapshot = None
+        if getattr(self, 'use_snapshot', None) and self.use_snapshot(request):
+            snapshot = self.get_snapshot()
+        if snapshot is not None:
+            rows = snapshot.rows
+        else:
+            rows = self.serialized_rows(self.filter_queryset(self.get_queryset()))
+        rows = iter(rows)
+        first = list(itertools.islice(rows, self.stream_chunk_size + 1))
+        if len(first) <= self.stream_chunk_size:
+            return Response(first)
+        rows = itertools.chain(first, rows)
+        return StreamingHttpResponse(self.stream(rows, request.accepted_renderer),
+                                     content_type=request.accepted_media_type)
+
+    def serialized_rows(self, queryset):
+        serializer = self.get_serializer(many=True).child
+        for instance in queryset.iterator(chunk_size=self.stream_chunk_size):
+            yield serializer.to_representation(instance)
+
+    def stream(self, rows, renderer):
+        dumps = NDJSONRenderer().dumps
+        ndjson = isinstance(renderer, NDJSONRenderer)
+        chunk = []
+        separator = '' if ndjson else '['
+        for row in rows:
+            if ndjson:
+                chunk.append(dumps(row) + '\n')
+            else:
+                chunk.append(separator + dumps(row))
+                separator = ','
+            if len(chunk) == self.stream_chunk_size:
+                yield ''.join(chunk).encode('utf-8')
+                chunk = []
+        if not ndjson:
+            chunk.append('[]' if separator == '[' else ']')
+        yield ''.join(chunk).encode('utf-8')
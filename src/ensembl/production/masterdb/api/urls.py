@@ -12,23 +12,8 @@
 from django.conf.urls import url, include
 from rest_framework_nested import routers
 
-from ensembl.production.masterdb.api import viewsets
+from ensembl.production.masterdb.api import schema, viewsets
 from ensembl.production.masterdb.api.router import MasterDBRestRouter
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Production DB API snippets",
-      default_version='v1',
-      description="Production DB Api Description",
-      contact=openapi.Contact(email="ensembl-production@ebi.ac.uk"),
-      license=openapi.License(name="Apache 2 License"),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
 
 # API router setup
 router = routers.DefaultRouter(trailing_slash=False)
@@ -43,10 +28,22 @@ router.register(prefix=r'attribtypes',
                 viewset=viewsets.AttribTypeViewSet,
                 basename='attribtypes')
 
+router.register(prefix=r'changes',
+                viewset=viewsets.ChangeJournalViewSet,
+                basename='changes')
+
+router.register(prefix=r'usage',
+                viewset=viewsets.UsageViewSet,
+                basename='usage')
+
 router_attrib.register(prefix=r'attrib',
                        viewset=viewsets.AttribViewSet,
                        basename='attrib')
 
+router_attrib.register(prefix=r'biotypes',
+                       viewset=viewsets.BiotypeNameViewSet,
+                       basename='biotypes')
+
 biotype_name_router = routers.SimpleRouter()
 biotype_name_router.register(r'biotypes', viewsets.BiotypeNameViewSet)
 
@@ -57,6 +54,7 @@ urlpatterns = [
     url(r'^', include(router.urls)),
     url(r'^', include(router_attrib.urls)),
     url(r'^', include(biotype_object_type_router.urls)),
-    url(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    url(r'^docs/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    # drf_yasg loaded on first hit
+    url(r'^swagger(?P<format>\.json|\.yaml)$', schema.schema_json, name='schema-json'),
+    url(r'^docs/$', schema.schema_redoc, name='schema-redoc'),
 ]
@@ -0,0 +1,148 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import functools
+import itertools
+from types import SimpleNamespace
+
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.encoding import is_protected_type
+from rest_framework import serializers
+
+from ensembl.production.masterdb.instrumentation import timed
+
+#: serializer fields whose representation of a database value is the value itself
+PASSTHROUGH_FIELDS = (serializers.BooleanField, serializers.CharField, serializers.IntegerField)
+
+
+class ValuesRepresentation:
+    """
+    Read only representation of a model serializer computed from `values_list()` tuples instead of model
+    instances: same JSON shape, nested model serializers of foreign keys included, with one query joining their
+    columns, restricted to `field_names` top level fields when set. Raises ValueError for serializers not made of
+    plain model fields.
+    """
+
+    def __init__(self, serializer, field_names=None):
+        self.lookups = []
+        self.entries = self.compile(serializer, '', field_names)
+
+    def compile(self, serializer, prefix, field_names=None):
+        opts = serializer.Meta.model._meta
+        entries = []
+        for field in serializer._readable_fields:
+            if field_names is not None and field.field_name not in field_names:
+                continue
+            source = field.source
+            if source == '*' or '.' in source:
+                raise ValueError('%s: no model field source' % field.field_name)
+            model_field = opts.get_field(source)
+            if model_field.many_to_many or model_field.one_to_many:
+                raise ValueError('%s: multiple values' % field.field_name)
+            if isinstance(field, serializers.BaseSerializer):
+                if not isinstance(field, serializers.ModelSerializer):
+                    raise ValueError('%s: not a model serializer' % field.field_name)
+                # foreign key column tells whether nested row exists
+                entries.append((field.field_name, self.column(prefix + model_field.attname), None,
+                                self.compile(field, prefix + source + '__')))
+            else:
+                entries.append((field.field_name, self.column(prefix + source), self.converter(field), None))
+        return entries
+
+    def column(self, lookup):
+        self.lookups.append(lookup)
+        return len(self.lookups) - 1
+
+    @staticmethod
+    def converter(field):
+        if type(field) in PASSTHROUGH_FIELDS:
+            return None
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+            # foreign key column holds the primary key
+            return None
+        if isinstance(field, serializers.ModelField):
+            model_field = field.model_field
+
+            def convert(value):
+                if is_protected_type(value):
+                    return value
+                return model_field.value_to_string(SimpleNamespace(**{model_field.attname: value}))
+
+            return convert
+        if isinstance(field, (serializers.SerializerMethodField, serializers.RelatedField)):
+            raise ValueError('%s: not a model field value' % field.field_name)
+        return field.to_representation
+
+    def to_representation(self, row, entries=None):
+        data = {}
+        for name, index, convert, nested in self.entries if entries is None else entries:
+            value = row[index]
+            if value is None:
+                data[name] = None
+            elif nested is not None:
+                data[name] = self.to_representation(row, nested)
+            elif convert is None:
+                data[name] = value
+            else:
+                data[name] = convert(value)
+        return data
+
+    def rows(self, queryset, chunk_size=100):
+        """
+        Representation of `queryset` rows, fetched by chunks of `chunk_size`.
+        """
+        values = queryset.values_list(*self.lookups).iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(itertools.islice(values, chunk_size))
+            if not chunk:
+                return
+            with timed('serializer'):
+                rows = [self.to_representation(row) for row in chunk]
+            yield from rows
+
+
+@functools.lru_cache(maxsize=256)
+def values_representation(serializer_class, field_names=None):
+    """
+    `ValuesRepresentation` of `serializer_class` (`field_names` ones only when set), None when it has fields not
+    read from model columns.
+    """
+    try:
+        return ValuesRepresentation(serializer_class(), field_names)
+    except (ValueError, FieldDoesNotExist):
+        return None
+
+
+class ValuesReadMixin:
+    """
+    Serialize list rows (streamed or cached in snapshots) from `values_list()` tuples with
+    `ValuesRepresentation` instead of model instances, when the viewset serializer allows it. Only the columns
+    of the fields selected by `fields` / `omit` query parameters are fetched.
+    """
+    values_read = True
+
+    def get_values_representation(self):
+        if not self.values_read:
+            return None
+        fields = self.get_serializer().fields
+        return values_representation(self.get_serializer_class(),
+                                     tuple(name for name, field in fields.items() if not field.write_only))
+
+    def serialized_rows(self, queryset):
+        representation = self.get_values_representation()
+        if representation is None:
+            return super().serialized_rows(queryset)
+        return representation.rows(queryset, self.stream_chunk_size)
+
+    def snapshot_rows(self):
+        if self.get_values_representation() is None:
+            return super().snapshot_rows()
+        return self.serialized_rows(self.get_queryset())
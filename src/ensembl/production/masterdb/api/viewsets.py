@@ -9,56 +9,186 @@
 #   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
+from django.utils import timezone
 from rest_framework import status
-from rest_framework import viewsets
+from rest_framework import mixins, viewsets
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from ensembl.production.masterdb.api.bulk import BulkUpsertMixin, chunks, CREATED
+from ensembl.production.masterdb.api.conditional import ConditionalGetMixin
+from ensembl.production.masterdb.api.filters import MasterDBFilterBackend
+from ensembl.production.masterdb.api.lookup import BatchLookupMixin
+from ensembl.production.masterdb.api.pagination import MasterDBCursorPagination, ChangeJournalPagination
+from ensembl.production.masterdb.api.renderers import NDJSONRenderer
+from ensembl.production.masterdb.api.snapshots import SnapshotReadMixin
+from ensembl.production.masterdb.api.streaming import StreamingListMixin
+from ensembl.production.masterdb.api.values import ValuesReadMixin
 from ensembl.production.masterdb.api.serializers import *
+from ensembl.production.masterdb.fields import json_digest
 from ensembl.production.masterdb.models import *
+from ensembl.production.masterdb import notifications
+from ensembl.production.masterdb.signals import biotype_update_message
 from .serializers import WebDataSerializer
 
 
-class WebDataViewSet(viewsets.ModelViewSet):
+class MasterDBModelViewSet(ConditionalGetMixin, ValuesReadMixin, StreamingListMixin, SnapshotReadMixin,
+                           viewsets.ModelViewSet):
+    """
+    Base viewset for masterdb tables: list filters declared in `query_filters`, opt-in keyset pagination,
+    conditional GET and cached snapshots driven by tables versions, streamed JSON / NDJSON lists serialized from
+    `values_list()` rows.
+    """
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+    pagination_class = MasterDBCursorPagination
+    filter_backends = [MasterDBFilterBackend]
+    query_filters = ('is_current', 'modified_at__gte')
+
+
+class WebDataViewSet(MasterDBModelViewSet):
     serializer_class = WebDataSerializer
     queryset = WebData.objects.all()
+    query_filters = ('modified_at__gte',)
 
 
-class AnalysisDescriptionViewSet(viewsets.ModelViewSet):
+class AnalysisDescriptionViewSet(BulkUpsertMixin, BatchLookupMixin, MasterDBModelViewSet):
     serializer_class = AnalysisDescriptionSerializerUser
-    queryset = AnalysisDescription.objects.filter()
+    # nested web data
+    queryset = AnalysisDescription.objects.select_related('web_data')
     lookup_field = 'logic_name'
+    query_filters = ('is_current', 'displayable', 'modified_at__gte')
+    version_models = (AnalysisDescription, WebData)
+    bulk_key = ('logic_name',)
+
+    def bulk_prepare(self, rows):
+        # one web data per distinct content, shared by all rows of the batch
+        contents = {}
+        for data in rows:
+            if data.get('web_data') is not None:
+                web_data = dict(data['web_data'])
+                contents.setdefault(json_digest(web_data.get('data')), (web_data, data.get('user')))
+        if not contents:
+            return
+        stored = {}
+        for chunk in chunks(contents.keys(), self.bulk_batch_size):
+            for elem in WebData.objects.filter(data_digest__in=chunk):
+                stored.setdefault(elem.data_digest, elem)
+        to_create, to_update = [], []
+        for digest, (web_data, user) in contents.items():
+            elem = stored.get(digest)
+            if elem is None:
+                to_create.append(WebData(created_by=user, **web_data))
+            elif any(self.differs(elem, name, value) for name, value in web_data.items() if name != 'data'):
+                for name, value in web_data.items():
+                    setattr(elem, name, value)
+                elem.modified_by = user
+                elem.modified_at = timezone.now()
+                to_update.append(elem)
+        WebData.objects.bulk_update(to_update, fields=['description', 'comment', 'modified_by', 'modified_at'],
+                                    batch_size=self.bulk_batch_size)
+        if to_create:
+            WebData.objects.bulk_create(to_create, batch_size=self.bulk_batch_size)
+            for chunk in chunks([elem.data_digest for elem in to_create], self.bulk_batch_size):
+                for elem in WebData.objects.filter(data_digest__in=chunk):
+                    stored.setdefault(elem.data_digest, elem)
+        for data in rows:
+            if data.get('web_data') is not None:
+                data['web_data'] = stored[json_digest(data['web_data'].get('data'))]
 
 
-class BiotypeNameViewSet(viewsets.ModelViewSet):
+class BiotypeNameViewSet(BulkUpsertMixin, BatchLookupMixin, MasterDBModelViewSet):
     serializer_class = BiotypeSerializerUser
     queryset = MasterBiotype.objects.filter()
     lookup_field = 'name'
+    snapshot_key = ('name', 'object_type')
+    query_filters = ('is_current', 'db_type', 'biotype_group', 'object_type', 'attrib_type__code', 'modified_at__gte')
+    bulk_key = ('name', 'object_type')
+    bulk_select_related = ('attrib_type',)
+
+    def bulk_write(self, valid, report):
+        updated = super().bulk_write(valid, report)
+        # bulk_create doesn't send signals: build db_type membership of created rows, updated ones being synced by
+        # MasterBiotype.objects.update()
+        written = {tuple(row['key'][name] for name in self.bulk_key) for row in report if row['status'] == CREATED}
+        if written:
+            MasterBiotypeDbType.replace(self.bulk_existing(written).values())
+        return updated
+
+    def bulk_updated(self, updated):
+        messages = []
+        for instance in updated:
+            updated_fields = instance.changed_fields()
+            if updated_fields:
+                messages.append(biotype_update_message(instance, updated_fields))
+        notifications.enqueue_many(messages)
 
 
-class BiotypeObjectTypeViewSet(viewsets.ModelViewSet):
+class BiotypeObjectTypeViewSet(MasterDBModelViewSet):
     serializer_class = BiotypeSerializerUser
     lookup_field = 'object_type'
     lookup_url_kwarg = 'type'
+    # rows depend on biotype name from URL
+    snapshot_enabled = False
+    query_filters = ('is_current', 'db_type', 'biotype_group', 'attrib_type__code', 'modified_at__gte')
 
     def get_queryset(self):
         return MasterBiotype.objects.filter(name=self.kwargs['biotype_name'])
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = BiotypeSerializerUser(queryset, many=True)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        serializer = self.get_serializer(queryset, many=True)
         if len(serializer.data) == 0:
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return Response(serializer.data)
 
 
-class AttribTypeViewSet(viewsets.ModelViewSet):
+class AttribTypeViewSet(BulkUpsertMixin, MasterDBModelViewSet):
     serializer_class = AttribTypeSerializerUser
     queryset = MasterAttribType.objects.all()
     lookup_field = 'code'
+    bulk_key = ('code',)
 
 
-class AttribViewSet(viewsets.ModelViewSet):
+class AttribViewSet(BulkUpsertMixin, MasterDBModelViewSet):
     serializer_class = AttribSerializerUser
-    queryset = MasterAttrib.objects.all()
+    # nested attrib type
+    queryset = MasterAttrib.objects.select_related('attrib_type')
     lookup_field = 'value'
+    query_filters = ('is_current', 'attrib_type__code', 'modified_at__gte')
+    version_models = (MasterAttrib, MasterAttribType)
+    bulk_key = ('attrib_type', 'value')
+
+    def bulk_prepare(self, rows):
+        # resolve all attrib types of the batch at once, creating the missing ones
+        types = {}
+        for data in rows:
+            types.setdefault(data['attrib_type']['code'], (dict(data['attrib_type']), data.get('user')))
+        stored = MasterAttribType.objects.upsert_codes(types, batch_size=self.bulk_batch_size)
+        for data in rows:
+            data['attrib_type'] = stored[data['attrib_type']['code']]
+
+
+class ChangeJournalViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Changes journal, paged from `since` sequence number, optionally for one `model` (e.g. `masterbiotype`).
+    """
+    serializer_class = ChangeJournalSerializer
+    queryset = ChangeJournal.objects.all()
+    pagination_class = ChangeJournalPagination
+    filter_backends = [MasterDBFilterBackend]
+    query_filters = ('model', 'operation')
+
+
+class UsageViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Databases using a master row, from usage index: e.g. `usage?model=masterbiotype&key=12`.
+    """
+    serializer_class = UsageCountSerializer
+    queryset = UsageCount.objects.select_related('database').order_by('-count', 'database__name')
+    pagination_class = MasterDBCursorPagination
+    filter_backends = [MasterDBFilterBackend]
+    query_filters = ('model', 'key', 'database__name')
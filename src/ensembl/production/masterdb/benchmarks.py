@@ -0,0 +1,476 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Performance benchmarks, not part of the test suite. Run with:
+
+    ./src/manage.py test ensembl.production.masterdb.benchmarks
+
+`MASTERDB_BENCHMARK_ROWS` sets the number of rows used (default 2000), `MASTERDB_BENCHMARK_TABLE_ROWS` the size
+of synthetic tables queried (default 100000), `MASTERDB_BENCHMARK_DATABASES` the number of SQLite stand-in target
+databases (default 1000), `MASTERDB_BENCHMARK_SCALE` the scale of `generate_synthetic_data` used by the routes
+suite (default 0.01, 1 being 100k biotypes and 1M attribs). Results are printed and appended as JSON lines to
+`MASTERDB_BENCHMARK_OUTPUT` when set, labelled with `MASTERDB_BENCHMARK_LABEL` (default: current git commit), to
+be compared between commits with `compare_benchmarks`.
+"""
+import importlib
+import io
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.test import TestCase, RequestFactory
+from django.urls import reverse, URLResolver
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from ensembl.production.masterdb.api import schema, urls as api_urls
+from ensembl.production.masterdb.api.filters import multiselect_membership
+from ensembl.production.masterdb.api.serializers import AnalysisDescriptionSerializerUser, AttribSerializerUser, \
+    AttribTypeSerializerUser, BiotypeSerializerUser
+from ensembl.production.masterdb.api.streaming import StreamingListMixin
+from ensembl.production.masterdb.api.values import values_representation
+from ensembl.production.masterdb.cache import snapshots
+from ensembl.production.masterdb.compliance import MetaRequirements, check_meta
+from ensembl.production.masterdb.models import AnalysisDescription, MasterAttrib, MasterAttribType, MasterBiotype, \
+    MetaKey, DB_TYPE_CHOICES_BIOTYPE
+from ensembl.production.masterdb.paginator import EstimatedCountPaginator
+from ensembl.production.masterdb.targets import fan_out
+
+ROWS = int(os.getenv('MASTERDB_BENCHMARK_ROWS', 2000))
+TABLE_ROWS = int(os.getenv('MASTERDB_BENCHMARK_TABLE_ROWS', 100000))
+DATABASES = int(os.getenv('MASTERDB_BENCHMARK_DATABASES', 1000))
+SCALE = float(os.getenv('MASTERDB_BENCHMARK_SCALE', 0.01))
+
+
+def benchmark_label():
+    label = os.getenv('MASTERDB_BENCHMARK_LABEL')
+    if label is None:
+        try:
+            label = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                   cwd=os.path.dirname(__file__)).stdout.strip() or None
+        except OSError:
+            pass
+    return label
+
+
+LABEL = benchmark_label()
+
+
+def record(name, rows, elapsed, **extra):
+    result = dict(benchmark=name, label=LABEL, rows=rows, seconds=round(elapsed, 4),
+                  rows_per_second=round(rows / elapsed, 1) if elapsed else None, **extra)
+    print(json.dumps(result))
+    output = os.getenv('MASTERDB_BENCHMARK_OUTPUT')
+    if output:
+        with open(output, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+    return result
+
+
+class BulkUpsertBenchmark(APITestCase):
+    fixtures = ['master_db']
+
+    def payload(self, size, suffix=''):
+        return [{'name': 'bench_%s%s' % (i, suffix), 'object_type': 'gene', 'db_type': 'core',
+                 'biotype_group': 'coding', 'user': 'testuser'} for i in range(size)]
+
+    def testBiotypeSingleVsBulk(self):
+        sample = max(ROWS // 10, 1)
+        start = time.perf_counter()
+        for row in self.payload(sample, '_single'):
+            response = self.client.post(reverse('type-list', kwargs={'biotype_name': row['name']}), row)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        record('biotype_single_post', sample, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        response = self.client.post(reverse('biotypes-bulk'), data=json.dumps(self.payload(ROWS)),
+                                    content_type='application/json')
+        record('biotype_bulk_create', ROWS, time.perf_counter() - start)
+        self.assertEqual(response.data['created'], ROWS)
+
+        payload = self.payload(ROWS)
+        for row in payload[::2]:
+            row['biotype_group'] = 'pseudogene'
+        start = time.perf_counter()
+        response = self.client.post(reverse('biotypes-bulk'),
+                                    data='\n'.join(json.dumps(row) for row in payload),
+                                    content_type='application/x-ndjson')
+        record('biotype_bulk_update', ROWS, time.perf_counter() - start)
+        self.assertEqual(response.data['updated'], (ROWS + 1) // 2)
+        self.assertEqual(MasterBiotype.objects.filter(name__startswith='bench_').count(), ROWS + sample)
+
+    def testAttribBulk(self):
+        payload = [{'value': 'bench_%s' % i, 'attrib_type': {'code': 'bench_%s' % (i % 50), 'name': 'bench'}}
+                   for i in range(ROWS)]
+        start = time.perf_counter()
+        response = self.client.post(reverse('attrib-bulk'), data=json.dumps(payload),
+                                    content_type='application/json')
+        record('attrib_bulk_create', ROWS, time.perf_counter() - start)
+        self.assertEqual(response.data['created'], ROWS)
+        self.assertEqual(MasterAttribType.objects.filter(code__startswith='bench_').count(), 50)
+
+
+class DbTypeMembershipBenchmark(TestCase):
+    repeat = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        db_types = [db_type for db_type, label in DB_TYPE_CHOICES_BIOTYPE]
+        MasterBiotype.objects.bulk_create(
+            [MasterBiotype(name='bench_%s' % i, object_type='gene',
+                           db_type=[db_types[i % len(db_types)], db_types[(i * 7) % len(db_types)]])
+             for i in range(TABLE_ROWS)], batch_size=2000)
+        MasterBiotype.objects.sync_db_types()
+
+    def timed(self, name, queryset):
+        start = time.perf_counter()
+        for _ in range(self.repeat):
+            count = queryset.count()
+        record(name, TABLE_ROWS, (time.perf_counter() - start) / self.repeat, matches=count)
+        return count
+
+    def testCoreBiotypes(self):
+        current = MasterBiotype.objects.filter(is_current=True)
+        contains = self.timed('db_type_icontains', current.filter(db_type__icontains='core'))
+        regex = self.timed('db_type_regex', current.filter(multiselect_membership('db_type', ['core'])))
+        membership = self.timed('db_type_membership', current.with_db_type('core'))
+        self.assertEqual(regex, membership)
+        # icontains also matches coreexpression* db types
+        self.assertGreater(contains, membership)
+
+
+class SnapshotCacheBenchmark(APITestCase):
+    fixtures = ['master_db']
+    repeat = 50
+
+    def testListFromSnapshot(self):
+        MasterBiotype.objects.bulk_create([MasterBiotype(name='bench_%s' % i, object_type='gene', db_type='core')
+                                           for i in range(ROWS)], batch_size=500)
+        url = reverse('biotypes-list')
+        for name, enabled in (('biotype_list_database', False), ('biotype_list_snapshot', True)):
+            with self.settings(MASTER_DB_CACHE=enabled):
+                self.client.get(url)
+                start = time.perf_counter()
+                for _ in range(self.repeat):
+                    response = self.client.get(url)
+                    # lists above one chunk are streamed
+                    rows = json.loads(b''.join(response.streaming_content)) if response.streaming \
+                        else response.data
+                record(name, len(rows), (time.perf_counter() - start) / self.repeat)
+
+
+class MetaComplianceBenchmark(TestCase):
+    keys = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        MetaKey.objects.bulk_create([MetaKey(name='bench.key_%s' % i, is_optional=i % 3 == 0, db_type='core',
+                                             is_multi_value=i % 5 == 0) for i in range(cls.keys)])
+        MetaKey.objects.sync_db_types()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.urls = []
+        for i in range(DATABASES):
+            path = os.path.join(self.tmp.name, 'species_%s_core_110_1' % i)
+            with sqlite3.connect(path) as db:
+                db.execute('CREATE TABLE meta (meta_id INTEGER PRIMARY KEY, species_id INTEGER, '
+                           'meta_key VARCHAR(40), meta_value VARCHAR(255))')
+                # every tenth database misses a key, every seventh has a duplicated one
+                db.executemany('INSERT INTO meta (species_id, meta_key, meta_value) VALUES (1, ?, ?)',
+                               [('bench.key_%s' % k, 'value') for k in range(self.keys) if i % 10 or k != 1] +
+                               ([('bench.key_2', 'again')] if i % 7 == 0 else []))
+            self.urls.append('sqlite:///' + path)
+
+    def testCheckDatabases(self):
+        requirements = MetaRequirements.load('core', 'main')
+        for workers in (1, 8):
+            start = time.perf_counter()
+            failed = sum(bool(issues[0] or issues[1]) for url, issues, error, seconds in fan_out(
+                self.urls, lambda connection, url: check_meta(connection, requirements), workers=workers))
+            record('meta_compliance_%s_workers' % workers, DATABASES, time.perf_counter() - start, failed=failed)
+        self.assertEqual(failed, len([i for i in range(DATABASES) if i % 10 == 0 or i % 7 == 0]))
+
+
+def api_routes(patterns=api_urls.urlpatterns, prefix=''):
+    """
+    (name, route, actions) of API url patterns, format suffixed variants excepted.
+    """
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from api_routes(pattern.url_patterns, prefix + str(pattern.pattern))
+        elif 'format>[a-z0-9]' not in str(pattern.pattern):
+            yield pattern.name, prefix + str(pattern.pattern), getattr(pattern.callback, 'actions', {'get': None})
+
+
+class RoutesBenchmark(APITestCase):
+    """
+    Every API route, every admin changelist (plain, searched and filtered), biotype change signal and CSV export
+    against `generate_synthetic_data` rows.
+    """
+    fixtures = ['master_db']
+    repeat = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        start = time.perf_counter()
+        call_command('generate_synthetic_data', scale=SCALE, web_data_kb=8, stdout=io.StringIO())
+        record('generate_synthetic_data', MasterBiotype.objects.count(), time.perf_counter() - start, scale=SCALE)
+        cls.user = get_user_model().objects.create_superuser('bench', 'bench@ebi.ac.uk', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        biotype = MasterBiotype.objects.filter(name__startswith='syn_').first()
+        # values of url kwargs
+        self.kwargs = dict(logic_name=AnalysisDescription.objects.filter(logic_name__startswith='syn_').first(
+            ).logic_name, code=MasterAttribType.objects.filter(code__startswith='syn_').first().code,
+                           biotype_name=biotype.name, type=biotype.object_type, format='.json')
+
+    def timed(self, name, call, rows=1, **extra):
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            response = call()
+            if getattr(response, 'streaming', False):
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            timings.append(time.perf_counter() - start)
+        self.assertLess(response.status_code, 400, name)
+        return record(name, rows, statistics.median(timings), status=response.status_code, bytes=size, **extra)
+
+    def bulk_payload(self, name):
+        rows = max(int(ROWS * SCALE), 10)
+        if name == 'biotypes-bulk':
+            return [{'name': 'bench_%s' % i, 'object_type': 'gene', 'db_type': 'core', 'biotype_group': 'coding'}
+                    for i in range(rows)]
+        if name == 'attribtypes-bulk':
+            return [{'code': 'bench_%s' % i, 'name': 'bench'} for i in range(rows)]
+        if name == 'attrib-bulk':
+            return [{'value': 'bench_%s' % i, 'attrib_type': {'code': 'bench', 'name': 'bench'}} for i in range(rows)]
+        return [{'logic_name': 'bench_%s' % i, 'display_label': 'bench'} for i in range(rows)]
+
+    def testApiRoutes(self):
+        for name, route, actions in api_routes():
+            if name == 'schema-redoc' and not apps.is_installed('drf_yasg'):
+                # html page rendered from drf_yasg templates
+                continue
+            kwargs = {key: value for key, value in self.kwargs.items() if '<%s>' % key in route}
+            url = reverse(name, kwargs=kwargs)
+            if 'get' in actions:
+                self.timed('api %s' % name, lambda: self.client.get(url), route=route)
+            elif 'post' in actions and name.endswith('-bulk'):
+                payload = json.dumps(self.bulk_payload(name))
+                self.timed('api %s' % name, lambda: self.client.post(url, data=payload,
+                                                                     content_type='application/json'), route=route)
+
+    def testAdminChangelists(self):
+        factory = RequestFactory()
+        for model, model_admin in admin.site._registry.items():
+            if model._meta.app_label != 'ensembl_production_db':
+                continue
+            url = reverse('admin:%s_%s_changelist' % (model._meta.app_label, model._meta.model_name))
+            name = 'admin %s' % model._meta.model_name
+            self.timed(name, lambda: self.client.get(url))
+            if model_admin.search_fields:
+                self.timed('%s search' % name, lambda: self.client.get(url, {'q': 'syn_1'}))
+            request = factory.get(url)
+            request.user = self.user
+            changelist = model_admin.get_changelist_instance(request)
+            for spec in changelist.filter_specs:
+                # first choice after "All"
+                choices = list(spec.choices(changelist))[1:2]
+                for choice in choices:
+                    filtered = url + choice['query_string']
+                    self.timed('%s filter %s' % (name, spec.title), lambda: self.client.get(filtered))
+
+    def testBiotypeSignal(self):
+        biotypes = list(MasterBiotype.objects.filter(name__startswith='syn_')[:ROWS // 10 or 1])
+        start = time.perf_counter()
+        for biotype in biotypes:
+            biotype.biotype_group = 'undefined' if biotype.biotype_group != 'undefined' else 'coding'
+            biotype.save()
+        record('biotype_save_signal', len(biotypes), time.perf_counter() - start)
+
+    def testCsvExport(self):
+        url = reverse('admin:ensembl_production_db_masterbiotype_changelist')
+        selected = MasterBiotype.objects.filter(is_current=True)
+        # whole changelist selected: posting every pk would exceed DATA_UPLOAD_MAX_NUMBER_FIELDS
+        self.timed('admin masterbiotype export_as_csv', lambda: self.client.post(
+            url, {'action': 'export_as_csv', 'select_across': '1', '_selected_action': [selected.first().pk]}),
+            rows=selected.count())
+
+
+class AdminCountBenchmark(TestCase):
+    """
+    Attrib and biotype changelists paged with exact counts (Django paginator) vs estimated ones, against
+    `generate_synthetic_data` rows.
+    """
+    fixtures = ['master_db']
+    repeat = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_synthetic_data', scale=SCALE, stdout=io.StringIO())
+        cls.user = get_user_model().objects.create_superuser('bench', 'bench@ebi.ac.uk', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def testChangelists(self):
+        for model in (MasterAttrib, MasterBiotype):
+            model_admin = admin.site._registry[model]
+            url = reverse('admin:ensembl_production_db_%s_changelist' % model._meta.model_name)
+            rows = model.objects.count()
+            for name, paginator in (('exact', Paginator), ('estimated', EstimatedCountPaginator)):
+                # counted above 1% of rows
+                with mock.patch.object(model_admin, 'paginator', paginator), \
+                        self.settings(MASTER_DB_EXACT_COUNT_THRESHOLD=rows // 100):
+                    for params in ({}, {'q': 'syn_1'}):
+                        self.client.get(url, params)
+                        timings = []
+                        for _ in range(self.repeat):
+                            start = time.perf_counter()
+                            response = self.client.get(url, params)
+                            timings.append(time.perf_counter() - start)
+                        self.assertEqual(response.status_code, status.HTTP_200_OK)
+                        record('admin %s changelist %s count%s' % (model._meta.model_name, name,
+                                                                   ' search' if params else ''),
+                               rows, statistics.median(timings), result_count=response.context['cl'].result_count)
+
+
+class SchemaBenchmark(APITestCase):
+    """
+    API urls cold import time (in a fresh interpreter) and OpenAPI schema latency, first and cached hits.
+    """
+
+    def testImport(self):
+        root = os.path.dirname(os.path.dirname(importlib.import_module(settings.SETTINGS_MODULE).__file__))
+        code = ('import django, sys, time; django.setup(); start = time.perf_counter(); '
+                'import ensembl.production.masterdb.api.urls; '
+                'print(time.perf_counter() - start, "drf_yasg" in sys.modules)')
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE, PYTHONPATH=root)
+        timings = []
+        for _ in range(5):
+            result = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, capture_output=True, text=True)
+            elapsed, loaded = result.stdout.split()
+            timings.append(float(elapsed))
+        record('api urls import', 1, statistics.median(timings), drf_yasg_loaded=loaded == 'True')
+
+    def testSchema(self):
+        schema.clear()
+        self.addCleanup(schema.clear)
+        url = reverse('schema-json', kwargs={'format': '.json'})
+        start = time.perf_counter()
+        response = self.client.get(url)
+        record('api schema-json first hit', 1, time.perf_counter() - start, bytes=len(response.content))
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            timings.append(time.perf_counter() - start)
+        record('api schema-json cached hit', 1, statistics.median(timings), bytes=len(response.content))
+
+
+class StreamingMemoryBenchmark(APITestCase):
+    """
+    Peak memory (tracemalloc) of unpaginated attrib and analysis description lists, buffered vs streamed, with and
+    without snapshots cache, as the tables grow from `generate_synthetic_data` scale 2 * `SCALE` to 4 times `SCALE`.
+    Snapshots are built before measuring: they are kept whatever the request, up to `MASTER_DB_SNAPSHOT_MAX_ROWS`.
+    """
+    fixtures = ['master_db']
+
+    def grow(self, prefix):
+        call_command('generate_synthetic_data', scale=SCALE, web_data_kb=8, prefix=prefix, stdout=io.StringIO())
+
+    def peak(self, url, streaming):
+        snapshots.clear()
+        with mock.patch.object(StreamingListMixin, 'use_streaming', return_value=streaming):
+            self.client.get(url)
+            tracemalloc.start()
+            start = time.perf_counter()
+            response = self.client.get(url)
+            size = sum(len(chunk) for chunk in response.streaming_content) if response.streaming \
+                else len(response.content)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return elapsed, peak, size
+
+    def testLists(self):
+        peaks = {}
+        for factor, prefix in enumerate(('syn_a_', 'syn_b_', 'syn_c_', 'syn_d_'), start=1):
+            self.grow(prefix)
+            if factor not in (2, 4):
+                continue
+            for cache in (False, True):
+                with self.settings(MASTER_DB_CACHE=cache):
+                    for name, model in (('attrib-list', MasterAttrib),
+                                        ('analysisdescription-list', AnalysisDescription)):
+                        rows = model.objects.count()
+                        for streaming in (False, True):
+                            elapsed, peak, size = self.peak(reverse(name), streaming)
+                            peaks[name, cache, streaming, factor] = peak
+                            record('api %s %s%s' % (name, 'streamed' if streaming else 'buffered',
+                                                    ' cached' if cache else ''), rows, elapsed,
+                                   peak_mb=round(peak / 2 ** 20, 2), bytes=size)
+        for name in ('attrib-list', 'analysisdescription-list'):
+            # buffered peak grows with the table, streamed one doesn't, rows being read from snapshot or database
+            self.assertGreater(peaks[name, False, False, 4], 1.5 * peaks[name, False, False, 2])
+            for cache in (False, True):
+                self.assertLess(peaks[name, cache, True, 4], 1.2 * peaks[name, cache, True, 2])
+
+
+class ValuesRepresentationBenchmark(TestCase):
+    """
+    Rows per second of list serialization, model serializers vs `values_list()` representation, on
+    `generate_synthetic_data` tables at `SCALE`.
+    """
+    fixtures = ['master_db']
+    serializers = (
+        (BiotypeSerializerUser, MasterBiotype.objects.all()),
+        (AttribTypeSerializerUser, MasterAttribType.objects.all()),
+        (AttribSerializerUser, MasterAttrib.objects.select_related('attrib_type')),
+        (AnalysisDescriptionSerializerUser, AnalysisDescription.objects.select_related('web_data')),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_synthetic_data', scale=SCALE, prefix='syn_', stdout=io.StringIO())
+
+    def testSerializers(self):
+        for serializer_class, queryset in self.serializers:
+            rows = queryset.count()
+            start = time.perf_counter()
+            child = serializer_class()
+            expected = [child.to_representation(instance) for instance in queryset.iterator()]
+            serializer = record('serializer %s' % serializer_class.__name__, rows, time.perf_counter() - start)
+            start = time.perf_counter()
+            values = list(values_representation(serializer_class).rows(queryset))
+            fast = record('values %s' % serializer_class.__name__, rows, time.perf_counter() - start)
+            self.assertEqual(json.dumps(values), json.dumps(expected))
+            self.assertGreater(fast['rows_per_second'], serializer['rows_per_second'])
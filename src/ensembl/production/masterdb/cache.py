@@ -0,0 +1,244 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import functools
+import itertools
+import logging
+import threading
+import time
+from collections import Counter
+from types import MappingProxyType
+
+from django.conf import settings
+from django.db.models import Count
+from rest_framework import serializers
+
+from ensembl.production.masterdb.models import TableVersion, MasterBiotype, MasterAttribType, MasterAttrib, \
+    MasterExternalDb, MetaKey, AnalysisDescription
+
+logger = logging.getLogger(__name__)
+
+#: cached controlled vocabularies, with their natural key
+VOCABULARIES = {
+    MasterBiotype: ('name', 'object_type'),
+    MasterAttribType: ('code',),
+    MasterAttrib: ('attrib_type', 'value'),
+    MasterExternalDb: ('db_name', 'db_release', 'is_current'),
+    MetaKey: ('name', 'is_optional', 'is_current'),
+    AnalysisDescription: ('logic_name',),
+}
+
+
+def cache_enabled():
+    return getattr(settings, 'MASTER_DB_CACHE', True)
+
+
+def snapshot_max_rows():
+    return getattr(settings, 'MASTER_DB_SNAPSHOT_MAX_ROWS', 50000)
+
+
+class AmbiguousKey(LookupError):
+    pass
+
+
+def row_value(row, path):
+    """
+    Value of a serialized row field, `path` being dotted for nested representations (e.g. `attrib_type.code`).
+    """
+    for name in path.split('.'):
+        row = row.get(name) if row is not None else None
+    return row
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({name: freeze(item) for name, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class Snapshot:
+    """
+    Immutable serialized rows of a table, as of `versions` table versions, indexed by natural key.
+    """
+
+    def __init__(self, versions, rows, key=()):
+        self.versions = versions
+        self.rows = tuple(freeze(dict(row)) for row in rows)
+        self.key = key
+        self._indexes = {}
+
+    def index(self, path):
+        index = self._indexes.get(path)
+        if index is None:
+            grouped = {}
+            for row in self.rows:
+                grouped.setdefault(str(row_value(row, path)), []).append(row)
+            index = self._indexes[path] = MappingProxyType({value: tuple(rows) for value, rows in grouped.items()})
+        return index
+
+    def filter(self, path, value):
+        """
+        Rows which `path` field equals `value` (compared as strings, as in URLs).
+        """
+        return self.index(path).get(str(value), ())
+
+    def get(self, *values):
+        """
+        Row matching natural key `values`, None if none.
+        :raises AmbiguousKey: when several rows match, i.e. snapshot key is no unique key
+        """
+        rows = [row for row in self.filter(self.key[0], values[0])
+                if all(str(row_value(row, path)) == str(value) for path, value in zip(self.key[1:], values[1:]))]
+        if len(rows) > 1:
+            raise AmbiguousKey('%s rows match %s %s' % (len(rows), self.key, values))
+        return rows[0] if rows else None
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class SnapshotCache:
+    """
+    In-process read-through cache of serialized table snapshots.
+    A snapshot is valid as long as versions of its tables (see `TableVersion`, bumped on each save, delete or bulk
+    operation, whatever the process) are unchanged. Local saves and deletes drop it right away (see signals).
+    Tables above `MASTER_DB_SNAPSHOT_MAX_ROWS` rows are not kept, their readers falling through to the database.
+    """
+
+    def __init__(self):
+        self._snapshots = {}
+        self._oversized = {}
+        self._tables = {}
+        self._lock = threading.Lock()
+        self.metrics = Counter()
+
+    def get(self, name, models, build, key=(), versions=None, max_rows=snapshot_max_rows):
+        """
+        :param name: snapshot name, e.g. serializer class
+        :param models: models the snapshot rows depend on
+        :param build: callable returning serialized rows, preferably as an iterator
+        :param key: natural key paths of rows
+        :param versions: current versions of `models` tables when already known
+        :param max_rows: rows above which no snapshot is built, None for no limit
+        :return: Snapshot, None when too large
+        """
+        versions = tuple(versions or TableVersion.objects.versions(*models))
+        limit = max_rows() if callable(max_rows) else max_rows
+        snapshot = self.current(name, versions)
+        if snapshot is not None or self.is_oversized(name, versions, limit):
+            return snapshot
+        with self._lock:
+            snapshot = self.current(name, versions)
+            if snapshot is not None or self.is_oversized(name, versions, limit):
+                return snapshot
+            self.metrics['%s.miss' % name] += 1
+            self._tables[name] = {model._meta.db_table for model in models}
+            start = time.perf_counter()
+            rows = build()
+            if limit is not None:
+                rows = list(itertools.islice(rows, limit + 1))
+                if len(rows) > limit:
+                    logger.info("%s snapshot above %s rows, reading from database", name, limit)
+                    self._snapshots.pop(name, None)
+                    self._oversized[name] = (versions, limit)
+                    self.metrics['%s.oversized' % name] += 1
+                    return None
+            snapshot = Snapshot(versions, rows, key)
+            logger.debug("Built %s snapshot (%s rows) in %.3fs", name, len(snapshot), time.perf_counter() - start)
+            self._oversized.pop(name, None)
+            self._snapshots[name] = snapshot
+        return snapshot
+
+    def current(self, name, versions):
+        snapshot = self._snapshots.get(name)
+        if snapshot is not None and snapshot.versions == versions:
+            # already built, whatever its size
+            self.metrics['%s.hit' % name] += 1
+            return snapshot
+        return None
+
+    def is_oversized(self, name, versions, limit):
+        """
+        Whether `name` snapshot is known to be above `limit` rows at `versions`.
+        """
+        oversized = self._oversized.get(name)
+        if oversized is not None and oversized[0] == versions and limit is not None and limit <= oversized[1]:
+            self.metrics['%s.oversized' % name] += 1
+            return True
+        return False
+
+    def invalidate(self, model):
+        table = model._meta.db_table
+        for name, tables in list(self._tables.items()):
+            if table in tables:
+                self._oversized.pop(name, None)
+                if self._snapshots.pop(name, None) is not None:
+                    self.metrics['%s.invalidation' % name] += 1
+
+    def clear(self):
+        self._snapshots.clear()
+        self._oversized.clear()
+        self._tables.clear()
+        self.metrics.clear()
+
+    def stats(self):
+        """
+        Hit / miss / invalidation / oversized counts and current rows per snapshot.
+        """
+        stats = {}
+        for metric, count in self.metrics.items():
+            name, kind = metric.rsplit('.', 1)
+            stats.setdefault(name, {'hit': 0, 'miss': 0, 'invalidation': 0, 'oversized': 0})[kind] = count
+        for name, snapshot in self._snapshots.items():
+            stats.setdefault(name, {'hit': 0, 'miss': 0, 'invalidation': 0, 'oversized': 0})['rows'] = len(snapshot)
+        return stats
+
+
+snapshots = SnapshotCache()
+
+
+@functools.lru_cache(maxsize=None)
+def vocabulary_serializer(model):
+    meta = type('Meta', (), {'model': model, 'fields': '__all__'})
+    return type('%sSnapshotSerializer' % model.__name__, (serializers.ModelSerializer,), {'Meta': meta})
+
+
+def vocabulary(model):
+    """
+    Snapshot of a controlled vocabulary table, for internal consumers, indexed by natural key (foreign keys as ids).
+    e.g. vocabulary(MasterAttribType).get('coding_cnt')
+    None when the table is above snapshot rows limit, consumers then query the model.
+    """
+    serializer = vocabulary_serializer(model)()
+
+    def build():
+        for instance in model._default_manager.all().iterator():
+            yield serializer.to_representation(instance)
+
+    return snapshots.get('vocabulary.%s' % model.__name__, (model,), build, key=VOCABULARIES[model])
+
+
+def facets(model, field_name, versions=None):
+    """
+    Snapshot of distinct values of `model` field with their rows count, indexed by value, most used first.
+    e.g. facets(MasterBiotype, 'so_term').get('protein_coding')['count']
+    :param versions: current version of `model` table when already known
+    """
+    def build():
+        rows = model._default_manager.order_by().values(field_name).annotate(count=Count('pk'))
+        return sorted(({'value': row[field_name], 'count': row['count']} for row in rows),
+                      key=lambda row: (-row['count'], str(row['value'])))
+
+    # one row per distinct value, always kept: admin list filters have no database fallback
+    return snapshots.get('facets.%s.%s' % (model.__name__, field_name), (model,), build, key=('value',),
+                         versions=versions, max_rows=None)
@@ -0,0 +1,74 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Check the `meta` table of target databases against `MetaKey` rules: mandatory keys for the database type and
+target site must be set, keys not flagged as multi valued must be set at most once (per species).
+"""
+from ensembl.production.masterdb.models import MetaKey, multiselect_values
+
+META_COUNTS = 'SELECT species_id, meta_key, COUNT(*) FROM meta GROUP BY species_id, meta_key'
+
+
+class MetaRequirements:
+    """
+    Meta keys rules for one database type and target site, loaded once and shared by all checked databases.
+    """
+
+    def __init__(self, db_type, target_site, mandatory, single):
+        self.db_type = db_type
+        self.target_site = target_site
+        #: keys which must be set for each species
+        self.mandatory = frozenset(mandatory)
+        #: keys which can't be set more than once for a species
+        self.single = frozenset(single)
+
+    @classmethod
+    def load(cls, db_type, target_site):
+        mandatory, multi, keys = set(), set(), set()
+        for name, is_optional, is_multi_value, target_sites in MetaKey.objects.filter(
+                is_current=True).with_db_type(db_type).values_list('name', 'is_optional', 'is_multi_value',
+                                                                    'target_site'):
+            keys.add(name)
+            if is_multi_value:
+                multi.add(name)
+            if not is_optional and target_site in multiselect_values(target_sites):
+                mandatory.add(name)
+        return cls(db_type, target_site, mandatory, keys - multi)
+
+    def check(self, counts):
+        """
+        :param counts: iterable of (species_id, meta_key, count) rows, species_id None for database wide keys
+        :return: (missing, multi_valued) lists of issues, sorted by species and key
+        """
+        shared = set()
+        species = {}
+        multi_valued = []
+        for species_id, key, count in counts:
+            (shared if species_id is None else species.setdefault(species_id, set())).add(key)
+            if count > 1 and key in self.single:
+                multi_valued.append(dict(species_id=species_id, meta_key=key, count=count))
+        # database wide keys apply to every species, and stand alone in databases without species rows
+        missing = [dict(species_id=species_id, meta_key=key)
+                   for species_id, keys in sorted(species.items() or [(None, set())], key=lambda item: item[0] or 0)
+                   for key in sorted(self.mandatory - keys - shared)]
+        multi_valued.sort(key=lambda issue: (issue['species_id'] or 0, issue['meta_key']))
+        return missing, multi_valued
+
+
+def check_meta(connection, requirements):
+    """
+    Check target database `connection` meta table with a single grouped query.
+    :return: (missing, multi_valued) lists of issues
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(META_COUNTS)
+        return requirements.check(cursor.fetchall())
@@ -0,0 +1,107 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import csv
+import datetime
+import json
+
+from django.contrib.admin.utils import lookup_field
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'excel'),
+    'tsv': ('text/tab-separated-values', 'excel-tab'),
+    'ndjson': ('application/x-ndjson', None),
+}
+
+
+class Echo:
+    """
+    File-like object handing back what is written, for csv writer to produce lines one by one.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_columns(model_admin, request):
+    return [name for name in model_admin.get_list_display(request) if name != 'action_checkbox']
+
+
+def export_select_related(model_admin, columns):
+    """
+    Foreign keys displayed as columns, plus admin `list_select_related` ones.
+    """
+    related = []
+    if isinstance(model_admin.list_select_related, (list, tuple)):
+        related += list(model_admin.list_select_related)
+    for name in columns:
+        try:
+            field = model_admin.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.many_to_one and name not in related:
+            related.append(name)
+    return related
+
+
+def export_value(model_admin, obj, name, flat=True):
+    field, attr, value = lookup_field(name, obj, model_admin)
+    if isinstance(value, list):
+        # MultiSelectField
+        return ','.join(value) if flat else list(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, models.Model):
+        return str(value)
+    if value is None:
+        return '' if flat else None
+    return value
+
+
+def export_rows(model_admin, queryset, columns):
+    queryset = queryset.select_related(*export_select_related(model_admin, columns))
+    return queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def stream_export(model_admin, request, queryset, export_format):
+    """
+    Stream `queryset` as CSV, TSV or NDJSON, with admin changelist columns.
+    Rows are fetched by chunks, so that memory use does not depend on selection size.
+    :param model_admin: ModelAdmin the export action is called from
+    :param request: the current request
+    :param queryset: selected objects
+    :param export_format: one of `EXPORT_FORMATS` keys
+    :return: StreamingHttpResponse
+    """
+    content_type, dialect = EXPORT_FORMATS[export_format]
+    columns = export_columns(model_admin, request)
+    rows = export_rows(model_admin, queryset, columns)
+    if dialect is None:
+        content = (json.dumps({name: export_value(model_admin, obj, name, flat=False) for name in columns},
+                              default=str) + '\n' for obj in rows)
+    else:
+        writer = csv.writer(Echo(), dialect=dialect)
+        content = (writer.writerow(line) for line in _lines(model_admin, rows, columns))
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+        model_admin.model._meta.model_name, export_format)
+    return response
+
+
+def _lines(model_admin, rows, columns):
+    yield columns
+    for obj in rows:
+        yield [export_value(model_admin, obj, name) for name in columns]
@@ -9,9 +9,49 @@
 #   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
+import hashlib
+import json
+
 from django.conf import settings
 from django.db import models
 
+
+def json_digest(data):
+    """
+    SHA-256 hex digest of the canonical JSON representation of `data` (sorted keys, compact separators),
+    so that documents only differing by keys order or formatting share the same digest.
+    `data` is the value as stored, a string being a JSON string value, not a JSON document to parse.
+    """
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class JSONDigestField(models.CharField):
+    """
+    Indexed digest of another JSON field in the same model, computed each time the instance is saved
+    (including bulk_create, but not QuerySet.update nor bulk_update).
+    """
+
+    def __init__(self, source=None, *args, **kwargs):
+        self.source = source
+        kwargs.setdefault('max_length', 64)
+        kwargs.setdefault('db_index', True)
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('null', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        data = getattr(model_instance, self.source)
+        value = json_digest(data) if data is not None else None
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
     from django_mysql.models import EnumField
 else:
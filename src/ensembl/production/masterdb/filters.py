@@ -9,11 +9,19 @@
 #   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
-from django.contrib.admin import SimpleListFilter
-from ensembl.production.masterdb.models import DB_TYPE_CHOICES_METAKEY, DB_TYPE_CHOICES_BIOTYPE, DC_META_SITE
+from django.conf import settings
+from django.contrib.admin import SimpleListFilter, FieldListFilter
+from django.urls import reverse
+from ensembl.production.masterdb.cache import facets
+from ensembl.production.masterdb.models import DB_TYPE_CHOICES_METAKEY, DB_TYPE_CHOICES_BIOTYPE, DC_META_SITE, \
+    TableVersion, db_type_query
 from ensembl.production.djcore.filters import BackEndListFilter
 
 
+def facet_limit():
+    return getattr(settings, 'MASTER_DB_FACET_LIMIT', 30)
+
+
 class IsCurrentFilter(BackEndListFilter):
     title = 'Is Current'
     parameter_name = 'is_current'
@@ -53,7 +61,7 @@ class DBTypeFilter(BackEndListFilter):
 
     def queryset(self, request, queryset):
         if self.value():
-            return queryset.filter(db_type__icontains=self.value())
+            return queryset.filter(db_type_query(queryset.model, [self.value()]))
         elif self.value() is None:
             return queryset
 
@@ -77,6 +85,72 @@ class BioTypeFilter(BackEndListFilter):
 
     def queryset(self, request, queryset):
         if self.value():
-            return queryset.filter(db_type__icontains=self.value())
+            return queryset.filter(db_type_query(queryset.model, [self.value()]))
         elif self.value() is None:
             return queryset
+
+
+class FacetListFilter(FieldListFilter):
+    """
+    Field values listed with their rows count from cached facets (see `cache.facets`), rebuilt when the table
+    changes, instead of a DISTINCT over the whole table on each changelist load.
+    Counts are whole table ones, whatever the other filters. Beyond `facet_limit()` distinct values, only the
+    selected one is listed, others being looked up from a type-ahead input (see `ProductionModelAdmin.facets_view`).
+    """
+    template = 'admin/facet_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = field_path
+        self.lookup_kwarg_isnull = '%s__isnull' % field_path
+        self.lookup_val = params.get(self.lookup_kwarg)
+        self.lookup_val_isnull = params.get(self.lookup_kwarg_isnull)
+        self.empty_value_display = model_admin.get_empty_value_display()
+        super().__init__(field, request, params, model, model_admin, field_path)
+        # one table version query per changelist, whatever the number of facets
+        versions = request.__dict__.setdefault('_facet_versions', {})
+        if model not in versions:
+            versions[model] = TableVersion.objects.versions(model)
+        self.facets = facets(model, field_path, versions=versions[model])
+        self.lazy = len(self.facets) > facet_limit()
+        opts = model_admin.model._meta
+        self.typeahead_url = reverse('admin:%s_%s_facets' % (opts.app_label, opts.model_name),
+                                     args=(field_path,), current_app=model_admin.admin_site.name)
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg, self.lookup_kwarg_isnull]
+
+    def has_output(self):
+        return len(self.facets) > 1 or self.lookup_val is not None or self.lookup_val_isnull is not None
+
+    def display(self, value, count):
+        return '%s (%s)' % (self.empty_value_display if value is None else value, count)
+
+    def choices(self, changelist):
+        self.query_string = changelist.get_query_string({}, [self.lookup_kwarg, self.lookup_kwarg_isnull])
+        yield {
+            'selected': self.lookup_val is None and self.lookup_val_isnull is None,
+            'query_string': self.query_string,
+            'display': 'All',
+        }
+        if self.lazy:
+            # selected value only
+            rows = list(self.facets.filter('value', self.lookup_val)) if self.lookup_val is not None else []
+            if self.lookup_val_isnull:
+                rows += [row for row in self.facets.filter('value', None) if row['value'] is None]
+        else:
+            rows = self.facets.rows
+        for row in rows:
+            if row['value'] is None:
+                yield {
+                    'selected': bool(self.lookup_val_isnull),
+                    'query_string': changelist.get_query_string({self.lookup_kwarg_isnull: 'True'},
+                                                                [self.lookup_kwarg]),
+                    'display': self.display(None, row['count']),
+                }
+            else:
+                yield {
+                    'selected': self.lookup_val == str(row['value']),
+                    'query_string': changelist.get_query_string({self.lookup_kwarg: row['value']},
+                                                                [self.lookup_kwarg_isnull]),
+                    'display': self.display(row['value'], row['count']),
+                }
@@ -0,0 +1,196 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Opt-in per request instrumentation: SQL queries count and time, serializer time, response size, likely N+1 queries.
+Enabled by adding `ensembl.production.masterdb.instrumentation.QueryInstrumentationMiddleware` to MIDDLEWARE.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+#: metrics of the request being processed, None when not instrumented
+current_metrics = ContextVar('current_metrics', default=None)
+
+_log_lock = threading.Lock()
+_log_handler = None
+_log_path = None
+
+
+def instrumentation_enabled():
+    return getattr(settings, 'MASTER_DB_INSTRUMENTATION', True)
+
+
+class RequestMetrics:
+    """
+    SQL queries and timings recorded while processing one request.
+    """
+
+    def __init__(self):
+        self.queries = Counter()
+        self.sql_time = 0.0
+        self.timings = Counter()
+        self._active = set()
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    def record_query(self, execute, sql, params, many, context):
+        # connection execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries[sql] += 1
+
+    @contextmanager
+    def timed(self, name):
+        """
+        Add block duration to `name` timing, nested blocks of the same name being counted once.
+        """
+        if name in self._active:
+            yield
+            return
+        self._active.add(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+            self._active.discard(name)
+
+    def repeated(self, threshold):
+        """
+        Same query (parameters aside) run at least `threshold` times, most likely N+1 selects.
+        """
+        return [dict(sql=sql, count=count) for sql, count in self.queries.most_common() if count >= threshold]
+
+
+@contextmanager
+def timed(name):
+    """
+    Time block as `name` in current request metrics, no-op when request is not instrumented.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+    else:
+        with metrics.timed(name):
+            yield
+
+
+def instrumentation_log():
+    """
+    Rotating JSON lines log, when `MASTER_DB_INSTRUMENTATION_LOG` file is set.
+    """
+    global _log_handler, _log_path
+    path = getattr(settings, 'MASTER_DB_INSTRUMENTATION_LOG', None)
+    if not path:
+        return None
+    with _log_lock:
+        if path != _log_path:
+            if _log_handler is not None:
+                _log_handler.close()
+            _log_handler = RotatingFileHandler(
+                path, maxBytes=getattr(settings, 'MASTER_DB_INSTRUMENTATION_LOG_BYTES', 10 * 1024 * 1024),
+                backupCount=getattr(settings, 'MASTER_DB_INSTRUMENTATION_LOG_BACKUPS', 5), delay=True)
+            _log_handler.setFormatter(logging.Formatter('%(message)s'))
+            _log_path = path
+    return _log_handler
+
+
+def server_timing(metrics, total):
+    return ', '.join((
+        'sql;dur=%.1f;desc="%s queries"' % (metrics.sql_time * 1000, metrics.query_count),
+        *('%s;dur=%.1f' % (name, seconds * 1000) for name, seconds in sorted(metrics.timings.items())),
+        'total;dur=%.1f' % (total * 1000),
+    ))
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record for each admin or API request the resolved view, SQL queries count and time, serializer time and
+    response size, exposed as `Server-Timing` header and appended to `MASTER_DB_INSTRUMENTATION_LOG`.
+    Queries repeated at least `MASTER_DB_INSTRUMENTATION_N_PLUS_ONE` times (default 5) are flagged.
+    Streaming responses are recorded until their content is exhausted, their `Server-Timing` header, sent first,
+    only covering the response start.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not instrumentation_enabled():
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        start = time.perf_counter()
+        with self.instrumented(metrics):
+            response = self.get_response(request)
+        response['Server-Timing'] = server_timing(metrics, time.perf_counter() - start)
+        if response.streaming:
+            response.streaming_content = self.stream(request, response, response.streaming_content, metrics, start)
+        else:
+            self.report(request, response, metrics, time.perf_counter() - start, len(response.content))
+        return response
+
+    @contextmanager
+    def instrumented(self, metrics):
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.record_query))
+                yield
+        finally:
+            current_metrics.reset(token)
+
+    def stream(self, request, response, content, metrics, start):
+        """
+        Response `content`, each chunk being produced with request metrics recording, reported once exhausted.
+        """
+        content = iter(content)
+        size = 0
+        try:
+            while True:
+                with self.instrumented(metrics):
+                    chunk = next(content, None)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.report(request, response, metrics, time.perf_counter() - start, size)
+
+    def report(self, request, response, metrics, total, size):
+        repeated = metrics.repeated(getattr(settings, 'MASTER_DB_INSTRUMENTATION_N_PLUS_ONE', 5))
+        if repeated:
+            logger.warning("%s %s: %s repeated queries, likely N+1", request.method, request.path, len(repeated))
+        handler = instrumentation_log()
+        if handler is not None:
+            match = request.resolver_match
+            handler.emit(logging.makeLogRecord({'msg': json.dumps({
+                'time': time.time(), 'method': request.method, 'path': request.path,
+                'view': (match.view_name or match._func_path) if match else None, 'status': response.status_code,
+                'queries': metrics.query_count, 'sql_ms': round(metrics.sql_time * 1000, 2),
+                'timings_ms': {name: round(seconds * 1000, 2) for name, seconds in metrics.timings.items()},
+                'total_ms': round(total * 1000, 2), 'bytes': size, 'repeated': repeated})}))
@@ -0,0 +1,63 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+from django.conf import settings
+
+from ensembl.production.masterdb.models import ChangeJournal, multiselect_values
+from multiselectfield import MultiSelectField
+
+
+def journal_enabled():
+    return getattr(settings, 'MASTER_DB_CHANGE_JOURNAL', True)
+
+
+def journal_delay():
+    """
+    Seconds journal entries are held back for, the longest a transaction writing them is expected to last.
+    """
+    return getattr(settings, 'MASTER_DB_CHANGE_JOURNAL_DELAY', 60)
+
+
+def natural_key(instance):
+    """
+    Natural key of a row as a dict, foreign keys as ids.
+    """
+    fields = [instance._meta.get_field(name) for name in instance.natural_key_fields] or [instance._meta.pk]
+    return {field.name: getattr(instance, field.attname) for field in fields}
+
+
+def row_image(instance):
+    """
+    Row values by database column, as downstream databases store them.
+    """
+    image = {}
+    for field in instance._meta.concrete_fields:
+        value = getattr(instance, field.attname)
+        if isinstance(field, MultiSelectField):
+            value = list(multiselect_values(value))
+        image[field.column] = value
+    return image
+
+
+def record(model, instances, operation):
+    """
+    Append `instances` changes to the journal.
+    :param model: changed rows model
+    :param instances: changed rows, as stored after change
+    :param operation: one of `ChangeJournal.OPERATIONS`
+    :return: list of journal entries
+    """
+    if not journal_enabled():
+        return []
+    return ChangeJournal.objects.bulk_create(
+        [ChangeJournal(model=model._meta.model_name, natural_key=natural_key(instance), operation=operation,
+                       row=row_image(instance) if operation != ChangeJournal.DELETE else None)
+         for instance in instances], batch_size=500)
@@ -0,0 +1,37 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ensembl.production.masterdb.api import schema
+
+
+class Command(BaseCommand):
+    help = 'Build compressed OpenAPI schema artefacts of current package version, served by swagger.json / .yaml'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default=getattr(settings, 'MASTER_DB_API_SCHEMA_DIR', None),
+                            help='Artefacts directory (default: MASTER_DB_API_SCHEMA_DIR)')
+        parser.add_argument('--url', help='API public root URL, e.g. https://services.ensembl.org/masterdb')
+        parser.add_argument('--formats', nargs='+', choices=list(schema.CONTENT_TYPES), default=['.json'],
+                            help='Schema formats, other ones being rendered on first request (default: .json)')
+
+    def handle(self, *args, **options):
+        directory = options['output_dir']
+        if not directory:
+            raise CommandError('No output directory: set --output-dir or MASTER_DB_API_SCHEMA_DIR')
+        os.makedirs(directory, exist_ok=True)
+        for format in options['formats']:
+            path = schema.write_artefact(format, directory, options['url'])
+            self.stdout.write('Wrote %s (%s bytes)' % (path, os.path.getsize(path)))
@@ -0,0 +1,60 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import json
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def load_results(path):
+    """
+    :return: dict benchmark name -> median seconds of all its runs in JSON lines file `path`
+    """
+    runs = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                runs.setdefault(result['benchmark'], []).append(result['seconds'])
+    return {name: statistics.median(seconds) for name, seconds in runs.items()}
+
+
+class Command(BaseCommand):
+    help = 'Compare two benchmark results files (MASTERDB_BENCHMARK_OUTPUT), e.g. from two commits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base', help='Reference results JSON lines file')
+        parser.add_argument('head', help='New results JSON lines file')
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help='Flag benchmarks at least this many times slower (or faster)')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error when a regression is flagged')
+
+    def handle(self, *args, **options):
+        base, head = load_results(options['base']), load_results(options['head'])
+        threshold = options['threshold']
+        regressions = 0
+        width = max([len('benchmark')] + [len(name) for name in base.keys() | head.keys()])
+        self.stdout.write('%-*s %10s %10s %8s' % (width, 'benchmark', 'base (s)', 'head (s)', 'ratio'))
+        for name in sorted(base.keys() | head.keys()):
+            if name not in base or name not in head:
+                self.stdout.write('%-*s %10s %10s' % (width, name, base.get(name, '-'), head.get(name, '-')))
+                continue
+            ratio = head[name] / base[name] if base[name] else float('inf')
+            line = '%-*s %10.4f %10.4f %7.2fx' % (width, name, base[name], head[name], ratio)
+            if ratio >= threshold:
+                regressions += 1
+                line = self.style.ERROR(line + ' slower')
+            elif ratio and ratio <= 1 / threshold:
+                line = self.style.SUCCESS(line + ' faster')
+            self.stdout.write(line)
+        if regressions and options['fail']:
+            raise CommandError('%s benchmark(s) at least %sx slower' % (regressions, threshold))
@@ -0,0 +1,155 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from ensembl.production.masterdb.models import AnalysisDescription, MasterAttrib, MasterAttribSet, MasterAttribType, \
+    MasterBiotype, MasterExternalDb, MetaKey, WebData, DB_TYPE_CHOICES_BIOTYPE, DB_TYPE_CHOICES_METAKEY
+
+SCALES = dict(attrib_types=1000, attribs=1000000, attrib_sets=5000, biotypes=100000, web_data=1000, analyses=10000,
+              external_dbs=5000, meta_keys=500)
+
+BIOTYPE_GROUPS = ('coding', 'pseudogene', 'snoncoding', 'lnoncoding', 'mnoncoding', 'LRG', 'undefined', 'no_group')
+EXTERNAL_DB_STATUSES = ('KNOWNXREF', 'KNOWN', 'XREF', 'PRED', 'ORTH', 'PSEUDO')
+EXTERNAL_DB_TYPES = ('ARRAY', 'ALT_TRANS', 'ALT_GENE', 'MISC', 'LIT', 'PRIMARY_DB_SYNONYM', 'ENSEMBL')
+COLOURS = ('gold', 'red', 'navyblue', 'grey50', 'orange', 'purple1', 'darkgreen', 'cadetblue')
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic master data at scale (biotypes, attribs in sets, large web data...) for benchmarks'
+
+    def add_arguments(self, parser):
+        for name, default in SCALES.items():
+            parser.add_argument('--%s' % name.replace('_', '-'), type=int, dest=name,
+                                help='Number of rows (default: %s x scale)' % default)
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiply all default row counts')
+        parser.add_argument('--web-data-kb', type=int, default=32, help='Approximate size of each web data blob')
+        parser.add_argument('--prefix', default='syn_', help='Prefix of generated names, codes and values')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, same seed generates same data')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--clear', action='store_true', help='Delete rows generated with the same prefix first')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        counts = {name: options[name] if options[name] is not None else max(int(default * options['scale']), 1)
+                  for name, default in SCALES.items()}
+        if options['clear']:
+            self.clear()
+        attrib_types = self.timed('attrib types', self.generate_attrib_types, counts['attrib_types'])
+        self.timed('attribs', self.generate_attribs, counts['attribs'], counts['attrib_sets'], attrib_types)
+        self.timed('biotypes', self.generate_biotypes, counts['biotypes'], attrib_types)
+        web_data = self.timed('web data', self.generate_web_data, counts['web_data'], options['web_data_kb'])
+        self.timed('analysis descriptions', self.generate_analyses, counts['analyses'], web_data)
+        self.timed('external dbs', self.generate_external_dbs, counts['external_dbs'])
+        self.timed('meta keys', self.generate_meta_keys, counts['meta_keys'])
+
+    def timed(self, label, generate, count, *args):
+        start = time.perf_counter()
+        result = generate(count, *args)
+        self.stdout.write('%s %s in %.1fs' % (count, label, time.perf_counter() - start))
+        return result
+
+    def batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def create(self, model, rows):
+        for batch in self.batches(rows):
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+
+    def generated(self, model, field):
+        return model.objects.filter(**{'%s__startswith' % field: self.prefix})
+
+    def clear(self):
+        for model, field in ((AnalysisDescription, 'logic_name'), (WebData, 'description'),
+                             (MasterBiotype, 'name'), (MasterAttrib, 'value'), (MasterAttribType, 'code'),
+                             (MasterExternalDb, 'db_name'), (MetaKey, 'name')):
+            deleted, _ = self.generated(model, field).delete()
+            self.stdout.write('%s %s row(s) deleted' % (deleted, model._meta.verbose_name))
+
+    def generate_attrib_types(self, count):
+        self.create(MasterAttribType, (MasterAttribType(code='%s%s' % (self.prefix, i), name='Synthetic type %s' % i,
+                                                        description='Synthetic attrib type %s' % i)
+                                       for i in range(count)))
+        return list(self.generated(MasterAttribType, 'code').values_list('pk', flat=True))
+
+    def generate_attribs(self, count, sets, attrib_types):
+        self.create(MasterAttrib, (MasterAttrib(attrib_type_id=attrib_types[i % len(attrib_types)],
+                                                value='%s%s' % (self.prefix, i)) for i in range(count)))
+        # attribs spread over `sets` consecutive attrib set ids
+        first = (MasterAttribSet.objects.aggregate(last=Max('attrib_set_id'))['last'] or 0) + 1
+        per_set = max(count // max(sets, 1), 1)
+        attribs = self.generated(MasterAttrib, 'value').order_by('pk').values_list('pk', flat=True)
+        self.create(MasterAttribSet, (MasterAttribSet(attrib_id=pk, attrib_set_id=first + min(i // per_set, sets - 1))
+                                      for i, pk in enumerate(attribs.iterator(chunk_size=self.batch_size))))
+
+    def generate_biotypes(self, count, attrib_types):
+        db_types = [db_type for db_type, label in DB_TYPE_CHOICES_BIOTYPE]
+        rng = self.rng
+        self.create(MasterBiotype, (
+            MasterBiotype(name='%s%s' % (self.prefix, i), object_type=('gene', 'transcript')[i % 2],
+                          db_type=rng.sample(db_types, rng.randint(1, 3)), biotype_group=rng.choice(BIOTYPE_GROUPS),
+                          attrib_type_id=rng.choice(attrib_types), so_acc='SO:%07d' % rng.randint(1, 2000000),
+                          so_term='synthetic_term_%s' % i, description='Synthetic biotype %s' % i)
+            for i in range(count)))
+        self.generated(MasterBiotype, 'name').sync_db_types()
+
+    def web_data_blob(self, i, size_kb):
+        rng = self.rng
+        # ~80 bytes per feature
+        features = [{'name': 'feature_%s_%s' % (i, j), 'colour': rng.choice(COLOURS), 'start': rng.randint(1, 10 ** 8),
+                     'strand': rng.choice((1, -1))} for j in range(size_kb * 1024 // 80)]
+        return {'type': 'synthetic_%s' % i, 'label_key': '[text_label] [display_label]', 'colour_key': '[biotype]',
+                'default': {'contigviewbottom': rng.choice(('normal', 'collapsed', 'expanded'))},
+                'features': features}
+
+    def generate_web_data(self, count, size_kb):
+        self.create(WebData, (WebData(data=self.web_data_blob(i, size_kb), description='%s%s' % (self.prefix, i))
+                              for i in range(count)))
+        return list(self.generated(WebData, 'description').values_list('pk', flat=True))
+
+    def generate_analyses(self, count, web_data):
+        rng = self.rng
+        self.create(AnalysisDescription, (
+            AnalysisDescription(logic_name='%s%s' % (self.prefix, i), display_label='Synthetic analysis %s' % i,
+                                description='Synthetic analysis description %s' % i,
+                                web_data_id=rng.choice(web_data + [None]), displayable=rng.random() > 0.2)
+            for i in range(count)))
+
+    def generate_external_dbs(self, count):
+        rng = self.rng
+        self.create(MasterExternalDb, (
+            MasterExternalDb(db_name='%s%s' % (self.prefix, i), db_release=str(rng.randint(1, 110)),
+                             status=rng.choice(EXTERNAL_DB_STATUSES), priority=rng.randint(1, 100),
+                             db_display_name='Synthetic external db %s' % i, type=rng.choice(EXTERNAL_DB_TYPES))
+            for i in range(count)))
+
+    def generate_meta_keys(self, count):
+        db_types = [db_type for db_type, label in DB_TYPE_CHOICES_METAKEY]
+        rng = self.rng
+        self.create(MetaKey, (
+            MetaKey(name='%s%s' % (self.prefix, i), is_optional=rng.random() > 0.5,
+                    db_type=rng.sample(db_types, rng.randint(1, 3)), is_multi_value=rng.random() > 0.8,
+                    target_site=rng.sample(('main', 'new'), rng.randint(1, 2)), description='Synthetic key %s' % i)
+            for i in range(count)))
+        self.generated(MetaKey, 'name').sync_db_types()
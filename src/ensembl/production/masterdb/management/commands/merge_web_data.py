@@ -0,0 +1,65 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+
+from ensembl.production.masterdb.fields import json_digest
+from ensembl.production.masterdb.models import AnalysisDescription, WebData
+
+
+class Command(BaseCommand):
+    help = 'Merge WebData sharing the same content (whatever the keys order) and repoint analysis descriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rehash', action='store_true',
+                            help='Recompute all digests first (e.g. after raw SQL updates on web_data)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report duplicates, do not merge')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['rehash']:
+            self.rehash(batch_size)
+        duplicates = WebData.objects.exclude(data_digest=None).values('data_digest').annotate(
+            kept=Min('web_data_id'), total=Count('web_data_id')).filter(total__gt=1)
+        # map each duplicated web_data_id to the one kept (lowest id)
+        merged = {}
+        kept_by_digest = {row['data_digest']: row['kept'] for row in duplicates}
+        for web_data_id, digest in WebData.objects.filter(data_digest__in=list(kept_by_digest)).values_list(
+                'web_data_id', 'data_digest').iterator(chunk_size=batch_size):
+            if web_data_id != kept_by_digest[digest]:
+                merged[web_data_id] = kept_by_digest[digest]
+        self.stdout.write('%s duplicated content(s), %s web data to merge' % (len(kept_by_digest), len(merged)))
+        if options['dry_run'] or not merged:
+            return
+        repointed = 0
+        with transaction.atomic():
+            # one UPDATE per kept web data, whatever the number of analysis descriptions pointing to duplicates
+            targets = {}
+            for web_data_id, kept in merged.items():
+                targets.setdefault(kept, []).append(web_data_id)
+            for kept, web_data_ids in targets.items():
+                repointed += AnalysisDescription.objects.filter(web_data_id__in=web_data_ids).update(web_data_id=kept)
+            WebData.objects.filter(web_data_id__in=list(merged)).delete()
+        self.stdout.write(self.style.SUCCESS(
+            'Merged %s web data, %s analysis description(s) repointed' % (len(merged), repointed)))
+
+    def rehash(self, batch_size):
+        batch = []
+        for web_data in WebData.objects.only('web_data_id', 'data', 'data_digest').iterator(chunk_size=batch_size):
+            digest = json_digest(web_data.data) if web_data.data is not None else None
+            if digest != web_data.data_digest:
+                web_data.data_digest = digest
+                batch.append(web_data)
+        WebData.objects.bulk_update(batch, ['data_digest'], batch_size=batch_size)
+        self.stdout.write('%s digest(s) updated' % len(batch))
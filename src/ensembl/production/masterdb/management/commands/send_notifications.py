@@ -0,0 +1,37 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import time
+
+from django.core.management.base import BaseCommand
+
+from ensembl.production.masterdb.notifications import deliver, notification_window
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending masterdb notifications, as one digest email per editor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Send all pending notifications, regardless of coalescing window')
+        parser.add_argument('--loop', action='store_true', help='Run as a background worker')
+        parser.add_argument('--interval', type=int, default=None,
+                            help='Seconds between two deliveries with --loop (default: MASTER_DB_NOTIFICATION_WINDOW)')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or notification_window()
+        while True:
+            sent = deliver(force=options['force'])
+            if sent or options['verbosity'] > 1:
+                self.stdout.write('%s notification email(s) sent' % sent)
+            if not options['loop']:
+                break
+            time.sleep(interval)
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-17 09:12
+
+import hashlib
+import json
+
+from django.db import migrations
+
+import ensembl.production.masterdb.fields
+
+
+def json_digest(data):
+    # frozen copy of fields.json_digest as of this migration
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def backfill_digest(apps, schema_editor):
+    WebData = apps.get_model('ensembl_production_db', 'WebData')
+    batch = []
+    for web_data in WebData.objects.only('web_data_id', 'data').iterator(chunk_size=500):
+        web_data.data_digest = json_digest(web_data.data) if web_data.data is not None else None
+        batch.append(web_data)
+        if len(batch) >= 500:
+            WebData.objects.bulk_update(batch, ['data_digest'])
+            batch = []
+    WebData.objects.bulk_update(batch, ['data_digest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensembl_production_db', '0003_metakey_target_site'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webdata',
+            name='data_digest',
+            field=ensembl.production.masterdb.fields.JSONDigestField(db_index=True, editable=False, max_length=64,
+                                                                     null=True, source='data',
+                                                                     verbose_name='Data digest'),
+        ),
+        migrations.RunPython(backfill_digest, migrations.RunPython.noop),
+    ]
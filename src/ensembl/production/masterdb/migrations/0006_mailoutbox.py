@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensembl_production_db', '0005_tableversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailOutbox',
+            fields=[
+                ('mail_id', models.AutoField(primary_key=True, serialize=False)),
+                ('editor', models.CharField(max_length=150)),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Mail Outbox',
+                'db_table': 'master_mail_outbox',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='mailoutbox',
+            index=models.Index(fields=['sent_at', 'editor'], name='master_mail_sent_at_9a663f_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.25 on 2026-10-17 19:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_db_types(apps, schema_editor):
+    for model_name, membership_name, owner_field in (('MasterBiotype', 'MasterBiotypeDbType', 'biotype'),
+                                                     ('MetaKey', 'MetaKeyDbType', 'meta_key')):
+        model = apps.get_model('ensembl_production_db', model_name)
+        membership = apps.get_model('ensembl_production_db', membership_name)
+        membership.objects.bulk_create([membership(**{owner_field + '_id': pk, 'db_type': db_type})
+                                        for pk, db_types in model.objects.values_list('pk', 'db_type').iterator()
+                                        for db_type in sorted(set(db_types or []))], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensembl_production_db', '0006_mailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetaKeyDbType',
+            fields=[
+                ('db_type', models.CharField(max_length=25)),
+                ('meta_key_db_type_id', models.AutoField(primary_key=True, serialize=False)),
+                ('meta_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='db_types', to='ensembl_production_db.metakey')),
+            ],
+            options={
+                'db_table': 'meta_key_db_type',
+            },
+        ),
+        migrations.CreateModel(
+            name='MasterBiotypeDbType',
+            fields=[
+                ('db_type', models.CharField(max_length=25)),
+                ('biotype_db_type_id', models.AutoField(primary_key=True, serialize=False)),
+                ('biotype', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='db_types', to='ensembl_production_db.masterbiotype')),
+            ],
+            options={
+                'db_table': 'master_biotype_db_type',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='metakeydbtype',
+            index=models.Index(fields=['db_type', 'meta_key'], name='meta_key_db_db_type_184965_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='metakeydbtype',
+            unique_together={('meta_key', 'db_type')},
+        ),
+        migrations.AddIndex(
+            model_name='masterbiotypedbtype',
+            index=models.Index(fields=['db_type', 'biotype'], name='master_biot_db_type_37da4a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='masterbiotypedbtype',
+            unique_together={('biotype', 'db_type')},
+        ),
+        migrations.RunPython(populate_db_types, migrations.RunPython.noop),
+    ]
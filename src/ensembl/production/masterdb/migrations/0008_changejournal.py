@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-17 19:40
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensembl_production_db', '0007_db_type_membership'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeJournal',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=64)),
+                ('natural_key', jsonfield.fields.JSONField(default=dict)),
+                ('operation', models.CharField(choices=[('insert', 'Insert'), ('update', 'Update'), ('delete', 'Delete')], max_length=6)),
+                ('row', jsonfield.fields.JSONField(help_text='Row as stored after change, empty for deletes', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Change Journal',
+                'db_table': 'master_change_journal',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='changejournal',
+            index=models.Index(fields=['model', 'seq'], name='master_chan_model_b900db_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.25 on 2026-10-17 21:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensembl_production_db', '0008_changejournal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageDatabase',
+            fields=[
+                ('usage_database_id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('checksum', models.CharField(max_length=64)),
+                ('indexed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Usage Database',
+                'db_table': 'master_usage_database',
+            },
+        ),
+        migrations.CreateModel(
+            name='UsageCount',
+            fields=[
+                ('usage_count_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=64)),
+                ('key', models.IntegerField()),
+                ('count', models.BigIntegerField()),
+                ('database', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counts', to='ensembl_production_db.usagedatabase')),
+            ],
+            options={
+                'verbose_name': 'Usage Count',
+                'db_table': 'master_usage_count',
+                'unique_together': {('database', 'model', 'key')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='usagecount',
+            index=models.Index(fields=['model', 'key'], name='master_usag_model_f668f4_idx'),
+        ),
+    ]
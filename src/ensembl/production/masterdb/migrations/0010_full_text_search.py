@@ -0,0 +1,70 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:10
+
+import json
+
+from django.db import migrations
+
+# frozen copy of search.SEARCH_FIELDS and document tables DDL as of this migration
+SEARCH_FIELDS = {
+    'analysisdescription': ('logic_name', 'display_label', 'description', 'web_data__data'),
+    'masterbiotype': ('name', 'object_type', 'db_type', 'biotype_group', 'attrib_type__name', 'description',
+                      'so_acc', 'so_term'),
+    'masterexternaldb': ('db_name', 'db_release', 'status', 'db_display_name', 'priority', 'type',
+                         'secondary_db_name', 'secondary_db_table', 'description'),
+}
+
+CREATE_TABLE = {
+    'sqlite': 'CREATE VIRTUAL TABLE %s USING fts5(content)',
+    'mysql': 'CREATE TABLE %s (object_id INTEGER NOT NULL PRIMARY KEY, content LONGTEXT NOT NULL, '
+             'FULLTEXT KEY content (content)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4',
+}
+
+
+def document_tables(apps):
+    for model_name in SEARCH_FIELDS:
+        model = apps.get_model('ensembl_production_db', model_name)
+        yield model, '%s_fts' % model._meta.db_table
+
+
+def document_text(values):
+    return ' '.join(json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+                    for value in values if value not in (None, ''))
+
+
+def create_document_tables(apps, schema_editor, batch_size=1000):
+    connection = schema_editor.connection
+    if connection.vendor not in CREATE_TABLE:
+        return
+    key = 'rowid' if connection.vendor == 'sqlite' else 'object_id'
+    with connection.cursor() as cursor:
+        for model, table in document_tables(apps):
+            table = connection.ops.quote_name(table)
+            cursor.execute(CREATE_TABLE[connection.vendor] % table)
+            documents = {}
+            for pk, *values in model._base_manager.using(connection.alias).order_by().values_list(
+                    'pk', *SEARCH_FIELDS[model._meta.model_name]).iterator(chunk_size=batch_size):
+                documents.setdefault(pk, []).extend(values)
+            rows = [(pk, document_text(values)) for pk, values in documents.items()]
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany('INSERT INTO %s (%s, content) VALUES (%%s, %%s)' % (table, key),
+                                   rows[start:start + batch_size])
+
+
+def drop_document_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in CREATE_TABLE:
+        return
+    with connection.cursor() as cursor:
+        for model, table in document_tables(apps):
+            cursor.execute('DROP TABLE IF EXISTS %s' % connection.ops.quote_name(table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensembl_production_db', '0009_usage_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_document_tables, drop_document_tables),
+    ]
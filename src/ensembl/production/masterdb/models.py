@@ -8,13 +8,17 @@
 import json
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connections, models, transaction, IntegrityError
+from django.db.models import F
+from django.dispatch import Signal
 from django.template.defaultfilters import truncatechars
+from django.utils import timezone
 from multiselectfield import MultiSelectField
 import jsonfield.fields
 
 from ensembl.production.djcore.models import NullTextField, BaseTimestampedModel, HasCurrent, HasDescription
 from ensembl.production.djcore.fields import EnumField
+from ensembl.production.masterdb.fields import JSONDigestField
 
 DB_TYPE_CHOICES_BIOTYPE = (
     ('cdna', 'cdna'),
@@ -50,9 +54,304 @@ DC_META_SITE = (
 )
 
 
-class WebData(BaseTimestampedModel, HasDescription):
+#: sent with `models` each time their tables version is bumped
+tables_changed = Signal()
+
+
+class TableVersionManager(models.Manager):
+
+    def bump(self, *models_classes):
+        """
+        Increment version counter for models tables, creating missing counters.
+        """
+        tables_changed.send(sender=TableVersion, models=models_classes)
+        for model in models_classes:
+            table = model._meta.db_table
+            if not self.filter(table=table).update(version=F('version') + 1):
+                _, created = self.get_or_create(table=table, defaults={'version': 1})
+                if not created:
+                    self.filter(table=table).update(version=F('version') + 1)
+
+    def versions(self, *models_classes):
+        """
+        Current version for each model table (0 if never changed), in one query.
+        """
+        tables = [model._meta.db_table for model in models_classes]
+        versions = dict(self.filter(table__in=tables).values_list('table', 'version'))
+        return [(table, versions.get(table, 0)) for table in tables]
+
+
+class TableVersion(models.Model):
+    """
+    Per-table change counter, bumped each time a row of a `VersionedModel` table is saved, deleted or bulk updated.
+    """
+    table = models.CharField(primary_key=True, max_length=64)
+    version = models.BigIntegerField(default=0)
+
+    objects = TableVersionManager()
+
+    class Meta:
+        app_label = 'ensembl_production_db'
+        db_table = 'master_table_version'
+
+    def __str__(self):
+        return '{}: {}'.format(self.table, self.version)
+
+
+#: sent with changed `instances` (as stored) and `operation` by bulk operations, which don't send model signals
+rows_changed = Signal()
+
+
+class VersionedQuerySet(models.QuerySet):
+    """
+    Bump table version on bulk operations, which don't send model signals, and send `rows_changed` when listened to.
+    Note: bulk_update relies on update().
+    """
+    batch_size = 500
+
+    def stored(self, pks):
+        """
+        Rows with `pks` primary keys as stored, by batches of `batch_size` rows.
+        """
+        queryset = self.model._base_manager.using(self.db)
+        for start in range(0, len(pks), self.batch_size):
+            yield list(queryset.filter(pk__in=pks[start:start + self.batch_size]))
+
+    def update(self, **kwargs):
+        track = rows_changed.has_listeners(self.model)
+        # updated rows may no longer match the queryset filters, only their primary keys are kept
+        pks = list(self.values_list('pk', flat=True).iterator()) if track else []
+        rows = super().update(**kwargs)
+        if rows:
+            TableVersion.objects.bump(self.model)
+            # one signal per batch, so that listeners never hold more than `batch_size` rows
+            for instances in self.stored(pks):
+                rows_changed.send(sender=self.model, instances=instances, operation='update')
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        track = rows_changed.has_listeners(self.model)
+        if track and not self.model.natural_key_fields and any(obj.pk is None for obj in objs) and \
+                not connections[self.db].features.can_return_rows_from_bulk_insert:
+            # inserted rows could not be told apart to fetch their primary key (see fetch_pks)
+            raise ValueError("%s has no natural key: bulk created rows need a primary key on %s" % (
+                self.model.__name__, connections[self.db].vendor))
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            TableVersion.objects.bump(self.model)
+            if track:
+                self.fetch_pks(objs)
+                rows_changed.send(sender=self.model, instances=objs, operation='insert')
+        return objs
+
+    def fetch_pks(self, objs):
+        """
+        Set primary keys of bulk created `objs`, not returned by every database backend, from their natural key.
+        Models without natural key must be bulk created with primary keys set (checked by bulk_create).
+        """
+        fields = [self.model._meta.get_field(name) for name in self.model.natural_key_fields]
+        missing = {tuple(getattr(obj, field.attname) for field in fields): obj for obj in objs if obj.pk is None}
+        if not (fields and missing):
+            return
+        keys = list(missing)
+        attnames = [field.attname for field in fields]
+        for start in range(0, len(keys), self.batch_size):
+            batch = keys[start:start + self.batch_size]
+            # one IN per field, a superset of the batch keys filtered out below: an OR of one condition per key
+            # costs the ORM quadratic time to build
+            query = models.Q()
+            for i, attname in enumerate(attnames):
+                values = {key[i] for key in batch}
+                field_query = models.Q(**{'%s__in' % attname: values - {None}})
+                if None in values:
+                    field_query |= models.Q(**{'%s__isnull' % attname: True})
+                query &= field_query
+            for pk, *key in self.model._base_manager.using(self.db).filter(query).values_list('pk', *attnames):
+                if tuple(key) in missing:
+                    missing[tuple(key)].pk = pk
+
+
+class VersionedModel(models.Model):
+    """
+    Models which table version is tracked (see signals).
+    """
+    #: fields identifying a row across databases, primary key if empty
+    natural_key_fields = ()
+    objects = VersionedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+
+def multiselect_values(value):
+    """
+    MultiSelectField value as a sorted tuple, whether loaded (list) or assigned as a comma separated string.
+    """
+    if isinstance(value, str):
+        value = value.split(',') if value else []
+    return tuple(sorted(set(value or [])))
+
+
+def db_type_query(model, db_types):
+    """
+    Exact `db_type` membership lookup from `model` indexed membership table (see `DbTypeMembership`):
+    `core` doesn't match `coreexpressionatlas`.
+    :param model: MasterBiotype or MetaKey
+    :param db_types: list of db types, matching rows with any of them
+    :return: Q object
+    """
+    rel = model._meta.get_field('db_types')
+    return models.Q(pk__in=rel.related_model.objects.filter(db_type__in=db_types).values(rel.field.attname))
+
+
+class DbTypeQuerySet(VersionedQuerySet):
+
+    def with_db_type(self, *db_types):
+        return self.filter(db_type_query(self.model, db_types))
+
+    def sync_db_types(self):
+        """
+        Rebuild db_type membership of selected rows, e.g. after bulk operations which don't send model signals.
+        """
+        self.model._meta.get_field('db_types').related_model.replace(self.only('pk', 'db_type'))
+
+    def update(self, **kwargs):
+        """
+        Update, rebuilding db_type membership of updated rows when `db_type` is set (bulk_update included).
+        """
+        if 'db_type' not in kwargs:
+            return super().update(**kwargs)
+        # rows may not match the filter any more once updated
+        pks = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        queryset = self.model._base_manager.using(self.db)
+        for start in range(0, len(pks), self.batch_size):
+            self.model._meta.get_field('db_types').related_model.replace(
+                queryset.filter(pk__in=pks[start:start + self.batch_size]).only('pk', 'db_type'))
+        return rows
+
+
+#: unique constraint violation codes: MySQL ER_DUP_ENTRY, PostgreSQL unique_violation
+UNIQUE_VIOLATION_CODES = (1062, '23505')
+
+
+def is_unique_violation(exc):
+    """
+    Whether IntegrityError `exc` is a unique constraint violation, e.g. a row inserted by a concurrent writer,
+    rather than another constraint (not null, foreign key...) failure.
+    """
+    cause = exc.__cause__
+    if getattr(cause, 'pgcode', None) in UNIQUE_VIOLATION_CODES:
+        return True
+    if getattr(cause, 'args', None) and cause.args[0] in UNIQUE_VIOLATION_CODES:
+        return True
+    # SQLite only reports messages
+    return str(exc).startswith('UNIQUE constraint failed')
+
+
+class AttribTypeQuerySet(VersionedQuerySet):
+
+    def upsert_codes(self, attrib_types, batch_size=500, retries=3):
+        """
+        Resolve attrib types by code in one query, creating missing ones and updating matched ones when a user is
+        given. Only matched rows are updated, and they are locked (select_for_update) until the enclosing transaction
+        ends. Codes concurrently inserted by another writer are read back after a unique constraint violation.
+        :param attrib_types: dict code -> (attrib type fields, user)
+        :param batch_size: bulk queries batch size
+        :param retries: inserts attempts on unique constraint violation
+        :return: dict code -> MasterAttribType
+        """
+        stored = self.select_for_update().in_bulk(list(attrib_types), field_name='code')
+        to_create, to_update = [], []
+        for code, (fields, user) in attrib_types.items():
+            elem = stored.get(code)
+            if elem is None:
+                to_create.append(self.model(created_by=user, **fields))
+            elif user is not None and any(getattr(elem, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(elem, name, value)
+                elem.modified_by = user
+                elem.modified_at = timezone.now()
+                to_update.append(elem)
+        self.bulk_update(to_update, fields=['name', 'description', 'is_current', 'modified_by', 'modified_at'],
+                         batch_size=batch_size)
+        if to_create:
+            try:
+                with transaction.atomic():
+                    self.bulk_create(to_create, batch_size=batch_size)
+            except IntegrityError as e:
+                if not retries or not is_unique_violation(e):
+                    raise
+                # created meanwhile by a concurrent writer: start over, matching them this time
+                return self.upsert_codes(attrib_types, batch_size=batch_size, retries=retries - 1)
+            stored.update(self.in_bulk([elem.code for elem in to_create], field_name='code'))
+        return stored
+
+
+class TrackedFieldsMixin:
+    """
+    Snapshot `tracked_fields` values when an instance is loaded from database, so that `changed_fields()`
+    lists updated values without querying the stored row again.
+    MultiSelectField values are compared as sets, foreign keys on their id.
+    """
+    tracked_fields = ()
+    _tracked_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_tracked_fields()
+        return instance
+
+    def _tracked_value(self, name):
+        field = self._meta.get_field(name)
+        value = getattr(self, field.attname)
+        if isinstance(field, MultiSelectField):
+            return multiselect_values(value)
+        return value
+
+    def snapshot_tracked_fields(self):
+        deferred = self.get_deferred_fields()
+        self._tracked_values = {name: self._tracked_value(name) for name in self.tracked_fields
+                                if self._meta.get_field(name).attname not in deferred}
+
+    def changed_fields(self):
+        """
+        :return: list of (field, old value, new value) for modified tracked fields, foreign keys values being
+        related objects ids on both sides.
+        """
+        if self.pk is None:
+            return []
+        if self._tracked_values is None:
+            # not loaded from database, fetch stored values
+            stored = type(self)._default_manager.filter(pk=self.pk).first()
+            if stored is None:
+                return []
+            self._tracked_values = stored._tracked_values
+        changes = []
+        for name, old_val in self._tracked_values.items():
+            new_val = self._tracked_value(name)
+            if old_val != new_val:
+                if isinstance(self._meta.get_field(name), MultiSelectField):
+                    old_val, new_val = list(old_val), list(new_val)
+                changes.append((name, old_val, new_val))
+        return changes
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.snapshot_tracked_fields()
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.snapshot_tracked_fields()
+
+
+class WebData(VersionedModel, BaseTimestampedModel, HasDescription):
+    natural_key_fields = ('data_digest',)
     web_data_id = models.AutoField(primary_key=True)
     data = jsonfield.JSONField(null=True)
+    data_digest = JSONDigestField(source='data', verbose_name='Data digest')
     comment = NullTextField(trim_cr=True)
     description = models.CharField(max_length=255, blank=True, null=True)
 
@@ -76,7 +375,9 @@ class WebData(BaseTimestampedModel, HasDescription):
         return '{}-{}'.format(self.pk, label_data)
 
 
-class AnalysisDescription(HasCurrent, BaseTimestampedModel, HasDescription):
+class AnalysisDescription(TrackedFieldsMixin, VersionedModel, HasCurrent, BaseTimestampedModel, HasDescription):
+    tracked_fields = ('logic_name', 'display_label', 'db_version', 'web_data', 'displayable', 'is_current')
+    natural_key_fields = ('logic_name',)
     analysis_description_id = models.AutoField(primary_key=True)
     logic_name = models.CharField(unique=True, max_length=128)
     description = NullTextField(trim_cr=True, blank=True, null=True)
@@ -94,7 +395,10 @@ class AnalysisDescription(HasCurrent, BaseTimestampedModel, HasDescription):
         return 'Analysis: {} ({})'.format(self.display_label, self.logic_name)
 
 
-class MasterAttribType(HasCurrent, BaseTimestampedModel, HasDescription):
+class MasterAttribType(TrackedFieldsMixin, VersionedModel, HasCurrent, BaseTimestampedModel, HasDescription):
+    tracked_fields = ('code', 'name', 'is_current')
+    objects = AttribTypeQuerySet.as_manager()
+    natural_key_fields = ('code',)
     attrib_type_id = models.AutoField(primary_key=True)
     code = models.CharField(unique=True, max_length=20)
     name = models.CharField(max_length=255)
@@ -109,7 +413,8 @@ class MasterAttribType(HasCurrent, BaseTimestampedModel, HasDescription):
         return '{}'.format(self.name)
 
 
-class MasterAttrib(HasCurrent, BaseTimestampedModel):
+class MasterAttrib(VersionedModel, HasCurrent, BaseTimestampedModel):
+    natural_key_fields = ('attrib_type', 'value')
     attrib_id = models.AutoField(primary_key=True)
     value = models.CharField(max_length=80)
     attrib_type = models.ForeignKey(MasterAttribType, db_column='attrib_type_id', null=True, on_delete=models.SET_NULL)
@@ -128,7 +433,8 @@ class MasterAttrib(HasCurrent, BaseTimestampedModel):
         super().clean()
 
 
-class MasterAttribSet(HasCurrent, BaseTimestampedModel):
+class MasterAttribSet(VersionedModel, HasCurrent, BaseTimestampedModel):
+    natural_key_fields = ('attrib_set_id', 'attrib')
     attrib_set_id = models.IntegerField()
     attrib = models.OneToOneField(MasterAttrib, db_column='attrib_id',
                                   on_delete=models.CASCADE, primary_key=True,
@@ -142,7 +448,10 @@ class MasterAttribSet(HasCurrent, BaseTimestampedModel):
         unique_together = [('attrib_set_id', 'attrib')]
 
 
-class MasterBiotype(HasCurrent, BaseTimestampedModel, HasDescription):
+class MasterBiotype(TrackedFieldsMixin, VersionedModel, HasCurrent, BaseTimestampedModel, HasDescription):
+    tracked_fields = ('object_type', 'biotype_group', 'attrib_type', 'db_type', 'is_current', 'so_acc')
+    objects = DbTypeQuerySet.as_manager()
+    natural_key_fields = ('name', 'object_type')
     biotype_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=64)
     is_dumped = models.BooleanField(default=True)
@@ -165,7 +474,9 @@ class MasterBiotype(HasCurrent, BaseTimestampedModel, HasDescription):
         verbose_name_plural = "BioTypes"
 
 
-class MasterExternalDb(HasCurrent, BaseTimestampedModel, HasDescription):
+class MasterExternalDb(TrackedFieldsMixin, VersionedModel, HasCurrent, BaseTimestampedModel, HasDescription):
+    tracked_fields = ('db_name', 'db_release', 'status', 'priority', 'type', 'is_current')
+    natural_key_fields = ('db_name', 'db_release', 'is_current')
     external_db_id = models.AutoField(primary_key=True)
     db_name = models.CharField(max_length=100)
     db_release = models.CharField(max_length=255, blank=True, null=True)
@@ -186,7 +497,8 @@ class MasterExternalDb(HasCurrent, BaseTimestampedModel, HasDescription):
         verbose_name_plural = 'External DBs'
 
 
-class MasterMiscSet(HasCurrent, BaseTimestampedModel, HasDescription):
+class MasterMiscSet(VersionedModel, HasCurrent, BaseTimestampedModel, HasDescription):
+    natural_key_fields = ('code',)
     misc_set_id = models.PositiveSmallIntegerField(primary_key=True)
     code = models.CharField(unique=True, max_length=25)
     name = models.CharField(max_length=255)
@@ -200,7 +512,7 @@ class MasterMiscSet(HasCurrent, BaseTimestampedModel, HasDescription):
         verbose_name_plural = "Miscellaneous Sets"
 
 
-class MasterUnmappedReason(BaseTimestampedModel, HasCurrent):
+class MasterUnmappedReason(VersionedModel, BaseTimestampedModel, HasCurrent):
     unmapped_reason_id = models.AutoField(primary_key=True)
     summary_description = models.CharField(max_length=255, blank=True, null=True)
     full_description = models.CharField(max_length=255, blank=True, null=True)
@@ -216,7 +528,10 @@ class MasterUnmappedReason(BaseTimestampedModel, HasCurrent):
         return truncatechars(self.summary_description, 35)
 
 
-class MetaKey(HasCurrent, BaseTimestampedModel, HasDescription):
+class MetaKey(TrackedFieldsMixin, VersionedModel, HasCurrent, BaseTimestampedModel, HasDescription):
+    tracked_fields = ('name', 'is_optional', 'db_type', 'is_multi_value', 'target_site', 'is_current')
+    objects = DbTypeQuerySet.as_manager()
+    natural_key_fields = ('name', 'is_optional', 'is_current')
     meta_key_id = models.AutoField(primary_key=True)
     name = models.CharField(verbose_name="Name", max_length=64)
     is_optional = models.BooleanField("Optional", default=False,
@@ -245,3 +560,142 @@ class MetaKey(HasCurrent, BaseTimestampedModel, HasDescription):
                 'Duplicated entry for %s (uniqueness check against is_optional, is_current, name FAILED)' % self.name)
 
         return super().clean()
+
+
+class DbTypeMembership(models.Model):
+    """
+    Normalized `db_type` MultiSelectField values, one row per db type, kept in sync on save (see signals).
+    """
+    owner_field = None
+    db_type = models.CharField(max_length=25)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def replace(cls, owners, batch_size=500):
+        """
+        Replace stored membership of `owners` with their current `db_type` values.
+        """
+        owners = list(owners)
+        for start in range(0, len(owners), batch_size):
+            batch = owners[start:start + batch_size]
+            cls.objects.filter(**{'%s__in' % cls.owner_field: [owner.pk for owner in batch]}).delete()
+            cls.objects.bulk_create([cls(**{cls.owner_field: owner, 'db_type': db_type})
+                                     for owner in batch for db_type in multiselect_values(owner.db_type)])
+
+    def __str__(self):
+        return self.db_type
+
+
+class MasterBiotypeDbType(DbTypeMembership):
+    owner_field = 'biotype'
+    biotype_db_type_id = models.AutoField(primary_key=True)
+    biotype = models.ForeignKey(MasterBiotype, on_delete=models.CASCADE, related_name='db_types')
+
+    class Meta:
+        app_label = 'ensembl_production_db'
+        db_table = 'master_biotype_db_type'
+        unique_together = ('biotype', 'db_type')
+        indexes = [models.Index(fields=['db_type', 'biotype'])]
+
+
+class MetaKeyDbType(DbTypeMembership):
+    owner_field = 'meta_key'
+    meta_key_db_type_id = models.AutoField(primary_key=True)
+    meta_key = models.ForeignKey(MetaKey, on_delete=models.CASCADE, related_name='db_types')
+
+    class Meta:
+        app_label = 'ensembl_production_db'
+        db_table = 'meta_key_db_type'
+        unique_together = ('meta_key', 'db_type')
+        indexes = [models.Index(fields=['db_type', 'meta_key'])]
+
+
+class ChangeJournal(models.Model):
+    """
+    Append-only journal of masterdb tables changes, for downstream databases to sync incrementally.
+    """
+    INSERT = 'insert'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    OPERATIONS = ((INSERT, 'Insert'), (UPDATE, 'Update'), (DELETE, 'Delete'))
+
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=64)
+    natural_key = jsonfield.JSONField(encoder_class='django.core.serializers.json.DjangoJSONEncoder')
+    operation = models.CharField(max_length=6, choices=OPERATIONS)
+    row = jsonfield.JSONField(null=True, encoder_class='django.core.serializers.json.DjangoJSONEncoder',
+                              help_text="Row as stored after change, empty for deletes")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'ensembl_production_db'
+        db_table = 'master_change_journal'
+        verbose_name = 'Change Journal'
+        indexes = [models.Index(fields=['model', 'seq'])]
+
+    def __str__(self):
+        return '{} {} {} {}'.format(self.seq, self.operation, self.model, self.natural_key)
+
+
+class UsageDatabase(models.Model):
+    """
+    Target database scanned by the usage index, with its tables checksum when last scanned.
+    """
+    usage_database_id = models.AutoField(primary_key=True)
+    name = models.CharField(unique=True, max_length=255)
+    checksum = models.CharField(max_length=64)
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'ensembl_production_db'
+        db_table = 'master_usage_database'
+        verbose_name = 'Usage Database'
+
+    def __str__(self):
+        return self.name
+
+
+class UsageCount(models.Model):
+    """
+    Inverted usage index: number of rows referencing master row `key` of `model` in a target database.
+    """
+    usage_count_id = models.BigAutoField(primary_key=True)
+    database = models.ForeignKey(UsageDatabase, on_delete=models.CASCADE, related_name='counts')
+    model = models.CharField(max_length=64)
+    key = models.IntegerField()
+    count = models.BigIntegerField()
+
+    class Meta:
+        app_label = 'ensembl_production_db'
+        db_table = 'master_usage_count'
+        verbose_name = 'Usage Count'
+        unique_together = ('database', 'model', 'key')
+        indexes = [models.Index(fields=['model', 'key'])]
+
+    def __str__(self):
+        return '{} {} in {}: {}'.format(self.model, self.key, self.database_id, self.count)
+
+
+class MailOutbox(models.Model):
+    """
+    Pending notification emails, coalesced per editor and delivered by `send_notifications` command.
+    """
+    mail_id = models.AutoField(primary_key=True)
+    editor = models.CharField(max_length=150)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    #: set while a delivery sends it, outside of any transaction
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'ensembl_production_db'
+        db_table = 'master_mail_outbox'
+        verbose_name = 'Mail Outbox'
+        indexes = [models.Index(fields=['sent_at', 'editor'])]
+
+    def __str__(self):
+        return '{} ({})'.format(self.subject, self.editor)
@@ -0,0 +1,102 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ensembl.production.masterdb.models import MailOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def notification_window():
+    """
+    Seconds during which changes from the same editor are coalesced in one digest email.
+    """
+    return getattr(settings, 'MASTER_DB_NOTIFICATION_WINDOW', 300)
+
+
+def enqueue(editor, subject, body):
+    return MailOutbox.objects.create(editor=str(editor), subject=subject, body=body)
+
+
+def enqueue_many(messages):
+    """
+    :param messages: iterable of (editor, subject, body)
+    """
+    return MailOutbox.objects.bulk_create(
+        [MailOutbox(editor=str(editor), subject=subject, body=body) for editor, subject, body in messages])
+
+
+def claim_timeout():
+    """
+    Seconds after which notifications claimed by a delivery which didn't complete are claimed again.
+    """
+    return getattr(settings, 'MASTER_DB_NOTIFICATION_CLAIM_TIMEOUT', 600)
+
+
+def claim(now, due_before, force=False):
+    """
+    Claim pending notifications of editors due for a digest, in a short transaction locking pending rows only
+    while they are marked, so that writers enqueuing notifications don't wait for emails to be sent.
+    :return: dict editor -> claimed messages, oldest first
+    """
+    stale_before = now - datetime.timedelta(seconds=claim_timeout())
+    with transaction.atomic():
+        pending = MailOutbox.objects.select_for_update().filter(sent_at=None).filter(
+            Q(claimed_at=None) | Q(claimed_at__lt=stale_before)).order_by('created_at', 'mail_id')
+        by_editor = {}
+        for message in pending:
+            by_editor.setdefault(message.editor, []).append(message)
+        by_editor = {editor: messages for editor, messages in by_editor.items()
+                     if force or messages[0].created_at <= due_before}
+        MailOutbox.objects.filter(pk__in=[message.pk for messages in by_editor.values() for message in messages]) \
+            .update(claimed_at=now)
+    return by_editor
+
+
+def deliver(now=None, force=False):
+    """
+    Send one digest email per editor, for editors which first pending notification is older than the
+    notification window (or all of them with `force`). Notifications are claimed first, then sent outside of any
+    transaction, and marked sent (or released on failure) one editor at a time.
+    :return: number of emails sent
+    """
+    now = now or timezone.now()
+    due_before = now - datetime.timedelta(seconds=notification_window())
+    sent = 0
+    for editor, messages in claim(now, due_before, force).items():
+        pks = [message.pk for message in messages]
+        subject = messages[0].subject if len(messages) == 1 else '%s (%s changes)' % (
+            messages[0].subject, len(messages))
+        try:
+            send_mail(
+                subject,
+                '%s just modified important fields in production Master DB, please check for:\n%s' % (
+                    editor, '\n'.join(message.body for message in messages)),
+                getattr(settings, 'DEFAULT_FROM_EMAIL', 'me@localhost'),
+                [getattr(settings, 'MASTER_DB_ALERTS_EMAIL', 'me@localhost')],
+                fail_silently=False
+            )
+        except Exception as e:
+            # released, retried on next run
+            logger.error("Unable to send notifications for %s: %s", editor, e)
+            MailOutbox.objects.filter(pk__in=pks).update(claimed_at=None)
+            continue
+        MailOutbox.objects.filter(pk__in=pks).update(sent_at=now)
+        sent += 1
+    return sent
@@ -0,0 +1,140 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Admin changelists paginator avoiding exact `COUNT(*)` over large tables, see `EstimatedCountPaginator`.
+"""
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from ensembl.production.masterdb.models import TableVersion, VersionedModel
+
+
+def exact_count_threshold():
+    return getattr(settings, 'MASTER_DB_EXACT_COUNT_THRESHOLD', 10000)
+
+
+class CountCache:
+    """
+    In-process LRU of queries counts, valid as long as versions of their tables are unchanged.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions):
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is None or cached[0] != versions:
+                return None
+            self._counts.move_to_end(key)
+            return cached[1]
+
+    def set(self, key, versions, count):
+        with self._lock:
+            self._counts[key] = (versions, count)
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.size:
+                self._counts.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+counts = CountCache()
+
+
+def versioned_models(queryset):
+    """
+    Models of tables `queryset` reads, None if one of them isn't versioned (see `TableVersion`).
+    """
+    tables = {alias.table_name for alias in queryset.query.alias_map.values()} or {queryset.model._meta.db_table}
+    tables.update(queryset.query.extra_tables)
+    models = {model._meta.db_table: model for model in apps.get_models() if model._meta.db_table in tables}
+    if set(models) != tables or not all(issubclass(model, VersionedModel) for model in models.values()):
+        return None
+    return sorted(models.values(), key=lambda model: model._meta.db_table)
+
+
+def table_rows_estimate(queryset):
+    """
+    Rows count of the queryset table from MySQL statistics, None when not available or `queryset` is filtered.
+    """
+    connection = connections[queryset.db]
+    query = queryset.query
+    if connection.vendor != 'mysql' or query.where or query.distinct or query.extra:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() '
+                       'AND TABLE_NAME = %s', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Exact count for result sets up to `exact_count_threshold()` rows, counted on a bounded subquery.
+    Larger ones are counted once per version of their tables (see `TableVersion`), MySQL tables statistics being used
+    instead for unfiltered changelists. Those estimates may be off for InnoDB tables: last pages may then be empty or
+    unreachable.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        threshold = exact_count_threshold()
+        queryset = queryset.order_by()
+        bounded = queryset[:threshold + 1].count()
+        if bounded <= threshold:
+            return bounded
+        estimate = table_rows_estimate(queryset)
+        if estimate is not None:
+            return max(estimate, bounded)
+        models = versioned_models(queryset)
+        if models is None:
+            return queryset.count()
+        sql, params = queryset.query.sql_with_params()
+        key = (queryset.db, sql, repr(params))
+        versions = tuple(TableVersion.objects.versions(*models))
+        count = counts.get(key, versions)
+        if count is None:
+            count = queryset.count()
+            counts.set(key, versions, count)
+        return count
+
+
+class EstimatedCountChangeList(ChangeList):
+    """
+    Changelist which unfiltered rows count, shown next to the filtered one (`show_full_result_count`), is counted
+    by the admin paginator as well.
+    """
+
+    def get_results(self, request):
+        root_queryset = self.root_queryset
+        paginator = self.model_admin.get_paginator(request, root_queryset, self.list_per_page)
+        self.root_queryset = SimpleNamespace(count=lambda: paginator.count)
+        try:
+            super().get_results(request)
+        finally:
+            self.root_queryset = root_queryset
@@ -0,0 +1,182 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Push master tables content to target (e.g. core) databases: rows of each target table are diffed against current
+master rows on their key, and only needed INSERT / UPDATE / DELETE statements are applied.
+"""
+import json
+
+from django.db import transaction
+
+from ensembl.production.masterdb.api.bulk import chunks
+from ensembl.production.masterdb.fields import json_digest
+from ensembl.production.masterdb.models import MasterAttribType, MasterBiotype, MasterExternalDb, MasterMiscSet, \
+    MasterUnmappedReason, AnalysisDescription
+
+
+class PushTable:
+    """
+    Target `table` populated from current rows of master `model`, keyed on `key` column.
+    Target columns are named after master ones.
+    """
+    #: comma separated SET columns, compared whatever the values order
+    set_columns = ()
+
+    def __init__(self, table, model, key, columns, set_columns=()):
+        self.table = table
+        self.model = model
+        self.key = key
+        self.columns = columns
+        self.set_columns = set_columns or self.set_columns
+
+    def master_queryset(self, db_type):
+        return self.model.objects.filter(is_current=True)
+
+    def master_rows(self, db_type):
+        """
+        :return: dict key -> values of `columns`, as written in target
+        """
+        fields = {field.column: field for field in self.model._meta.concrete_fields}
+        attnames = [fields[column].attname for column in (self.key,) + self.columns]
+        rows = {}
+        for key, *values in self.master_queryset(db_type).values_list(*attnames):
+            rows[key] = tuple(','.join(value) if isinstance(value, list) else value for value in values)
+        return rows
+
+    def target_rows(self, cursor, quote):
+        cursor.execute('SELECT %s FROM %s' % (', '.join(quote(column) for column in (self.key,) + self.columns),
+                                               quote(self.table)))
+        return {key: tuple(values) for key, *values in cursor.fetchall()}
+
+    def normalize(self, column, value):
+        if isinstance(value, bytes):
+            value = value.decode()
+        if value is None or value == '':
+            return None
+        if isinstance(value, bool):
+            return str(int(value))
+        if column in self.set_columns:
+            return ','.join(sorted(value.split(',')))
+        return str(value)
+
+    def differs(self, master, target):
+        return any(self.normalize(column, m) != self.normalize(column, t)
+                   for column, m, t in zip(self.columns, master, target))
+
+    def diff(self, master, target, delete=True):
+        """
+        :return: (inserts, updates, deletes, unchanged count)
+        """
+        inserts = [(key,) + values for key, values in master.items() if key not in target]
+        updates = [values + (key,) for key, values in master.items()
+                   if key in target and self.differs(values, target[key])]
+        deletes = [(key,) for key in target if key not in master] if delete else []
+        unchanged = len(master) - len(inserts) - len(updates)
+        return inserts, updates, deletes, unchanged
+
+    def push(self, connection, master, batch_size=1000, dry_run=False):
+        """
+        Apply minimal changes to target table, in one transaction.
+        :return: dict of inserted / updated / deleted / unchanged rows counts
+        """
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            target = self.target_rows(cursor, quote)
+        inserts, updates, deletes, unchanged = self.diff(master, target)
+        if not dry_run:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                self.write(cursor, quote, inserts, updates, deletes, batch_size)
+        return dict(inserted=len(inserts), updated=len(updates), deleted=len(deletes), unchanged=unchanged)
+
+    def write(self, cursor, quote, inserts, updates, deletes, batch_size):
+        table, key = quote(self.table), quote(self.key)
+        statements = (
+            ('DELETE FROM %s WHERE %s = %%s' % (table, key), deletes),
+            ('UPDATE %s SET %s WHERE %s = %%s' % (table, ', '.join('%s = %%s' % quote(c) for c in self.columns), key),
+             updates),
+            ('INSERT INTO %s (%s) VALUES (%s)' % (table, ', '.join(quote(c) for c in (self.key,) + self.columns),
+                                                  ', '.join(['%s'] * (len(self.columns) + 1))), inserts),
+        )
+        for sql, rows in statements:
+            for batch in chunks(rows, batch_size):
+                cursor.executemany(sql, batch)
+
+
+class BiotypeTable(PushTable):
+    set_columns = ('db_type',)
+
+    def master_queryset(self, db_type):
+        # biotypes relevant for target database type only
+        return super().master_queryset(db_type).with_db_type(db_type)
+
+
+class AnalysisDescriptionTable(PushTable):
+    """
+    Descriptions of analyses present in target `analysis` table, matched on logic name: analyses are neither
+    created nor deleted.
+    """
+
+    def __init__(self):
+        super().__init__('analysis_description', AnalysisDescription, 'analysis_id',
+                         ('description', 'display_label', 'displayable', 'web_data'))
+
+    def master_rows(self, db_type):
+        rows = {}
+        for logic_name, description, display_label, displayable, data in self.master_queryset(db_type).values_list(
+                'logic_name', 'description', 'display_label', 'displayable', 'web_data__data'):
+            if data is not None:
+                data = json.dumps(data)
+            rows[logic_name.lower()] = (description, display_label, int(displayable), data)
+        return rows
+
+    def normalize(self, column, value):
+        if column == 'web_data' and value:
+            value = value.decode() if isinstance(value, bytes) else value
+            try:
+                return json_digest(json.loads(value))
+            except ValueError:
+                # legacy value which is no JSON document: compared as is, i.e. overwritten by master one
+                return value
+        return super().normalize(column, value)
+
+    def push(self, connection, master, batch_size=1000, dry_run=False):
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT a.logic_name, a.analysis_id, %s FROM %s a LEFT JOIN %s d ON a.analysis_id = '
+                           'd.analysis_id' % (', '.join('d.%s' % quote(column) for column in self.columns),
+                                              quote('analysis'), quote(self.table)))
+            analyses = cursor.fetchall()
+        # re-key master rows on target analysis ids
+        by_id = {analysis_id: master[logic_name.lower()] for logic_name, analysis_id, *values in analyses
+                 if logic_name.lower() in master}
+        target = {analysis_id: tuple(values) for logic_name, analysis_id, *values in analyses
+                  if values[1] is not None}
+        inserts, updates, deletes, unchanged = self.diff(by_id, target, delete=False)
+        if not dry_run:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                self.write(cursor, quote, inserts, updates, deletes, batch_size)
+        return dict(inserted=len(inserts), updated=len(updates), deleted=0, unchanged=unchanged)
+
+
+PUSH_TABLES = (
+    PushTable('attrib_type', MasterAttribType, 'attrib_type_id', ('code', 'name', 'description')),
+    BiotypeTable('biotype', MasterBiotype, 'biotype_id',
+                 ('name', 'object_type', 'db_type', 'attrib_type_id', 'description', 'biotype_group', 'so_acc',
+                  'so_term')),
+    PushTable('external_db', MasterExternalDb, 'external_db_id',
+              ('db_name', 'db_release', 'status', 'priority', 'db_display_name', 'type', 'secondary_db_name',
+               'secondary_db_table', 'description')),
+    PushTable('misc_set', MasterMiscSet, 'misc_set_id', ('code', 'name', 'description', 'max_length')),
+    PushTable('unmapped_reason', MasterUnmappedReason, 'unmapped_reason_id',
+              ('summary_description', 'full_description')),
+    AnalysisDescriptionTable(),
+)
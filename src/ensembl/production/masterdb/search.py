@@ -0,0 +1,138 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Full-text search over masterdb tables: each searchable model has a document table (`<table>_fts`) holding the
+concatenated text of its search fields, keyed on the row primary key, as a SQLite FTS5 virtual table or a MySQL
+table with a FULLTEXT index. Documents are kept in sync by signals (see `signals`).
+"""
+import json
+import re
+
+from django.conf import settings
+from django.db import connection as default_connection
+
+from ensembl.production.masterdb.models import AnalysisDescription, MasterBiotype, MasterExternalDb
+
+#: searched fields per model, related fields allowed
+SEARCH_FIELDS = {
+    AnalysisDescription: ('logic_name', 'display_label', 'description', 'web_data__data'),
+    MasterBiotype: ('name', 'object_type', 'db_type', 'biotype_group', 'attrib_type__name', 'description', 'so_acc',
+                    'so_term'),
+    MasterExternalDb: ('db_name', 'db_release', 'status', 'db_display_name', 'priority', 'type', 'secondary_db_name',
+                       'secondary_db_table', 'description'),
+}
+
+VENDORS = ('sqlite', 'mysql')
+
+WORD = re.compile(r'\w+')
+
+
+def search_enabled(connection=default_connection):
+    return getattr(settings, 'MASTER_DB_FULL_TEXT_SEARCH', True) and connection.vendor in VENDORS
+
+
+def is_searchable(model):
+    return model in SEARCH_FIELDS and search_enabled()
+
+
+def document_table(model):
+    return '%s_fts' % model._meta.db_table
+
+
+def document_text(values):
+    return ' '.join(json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+                    for value in values if value not in (None, ''))
+
+
+def index(model, pks=None, connection=default_connection, batch_size=1000):
+    """
+    (Re)build documents of `model` rows `pks`, all rows when None.
+    """
+    if connection.vendor not in VENDORS:
+        return
+    fields = SEARCH_FIELDS[model]
+    table = connection.ops.quote_name(document_table(model))
+    queryset = model._base_manager.using(connection.alias).order_by()
+    if pks is not None:
+        pks = list(pks)
+        if not pks:
+            return
+        queryset = queryset.filter(pk__in=pks)
+    # one document per row, whatever the number of related values
+    documents = {}
+    for pk, *values in queryset.values_list('pk', *fields).iterator(chunk_size=batch_size):
+        documents.setdefault(pk, []).extend(values)
+    key = 'rowid' if connection.vendor == 'sqlite' else 'object_id'
+    insert = 'INSERT OR REPLACE' if connection.vendor == 'sqlite' else 'REPLACE'
+    with connection.cursor() as cursor:
+        if pks is None:
+            cursor.execute('DELETE FROM %s' % table)
+        else:
+            # documents of rows gone, others are replaced below
+            gone = [pk for pk in pks if pk not in documents]
+            for start in range(0, len(gone), batch_size):
+                batch = gone[start:start + batch_size]
+                cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (table, key, ', '.join(['%s'] * len(batch))),
+                               batch)
+        rows = [(pk, document_text(values)) for pk, values in documents.items()]
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany('%s INTO %s (%s, content) VALUES (%%s, %%s)' % (insert, table, key),
+                               rows[start:start + batch_size])
+
+
+def unindex(model, pks, connection=default_connection):
+    index(model, [pk for pk in pks if pk is not None], connection=connection)
+
+
+def match_expression(connection, search_term):
+    """
+    Backend query matching all words of `search_term` as prefixes, None when it has no word.
+    """
+    terms = [term for term in search_term.split() if WORD.search(term)]
+    if not terms:
+        return None
+    if connection.vendor == 'sqlite':
+        # each term is a phrase of its tokens (e.g. IG_C_gene -> ig c gene), last one a prefix
+        return ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+    expression = []
+    for term in terms:
+        words = WORD.findall(term)
+        expression.append('+%s*' % words[0] if len(words) == 1 else '+"%s"' % ' '.join(words))
+    return ' '.join(expression)
+
+
+def search(queryset, search_term, ranked=True):
+    """
+    Rows of `queryset` matching `search_term`, best matches first when `ranked`, `search_rank` being annotated.
+    :return: filtered queryset, None when `search_term` has no word to search
+    """
+    connection = default_connection
+    expression = match_expression(connection, search_term)
+    if expression is None:
+        return None
+    model = queryset.model
+    quote = connection.ops.quote_name
+    table = quote(document_table(model))
+    pk = '%s.%s' % (quote(model._meta.db_table), quote(model._meta.pk.column))
+    if connection.vendor == 'sqlite':
+        where = ['%s.rowid = %s' % (table, pk), '%s MATCH %%s' % table]
+        # bm25: the lower the better
+        rank = 'bm25(%s)' % table
+    else:
+        where = ['%s.object_id = %s' % (table, pk), 'MATCH (%s.content) AGAINST (%%s IN BOOLEAN MODE)' % table]
+        rank = '-MATCH (%s.content) AGAINST (%%s IN BOOLEAN MODE)' % table
+    queryset = queryset.extra(tables=[document_table(model)], where=where, params=[expression])
+    if ranked:
+        queryset = queryset.extra(select={'search_rank': rank},
+                                  select_params=[expression] if connection.vendor == 'mysql' else [],
+                                  order_by=['search_rank'])
+    return queryset
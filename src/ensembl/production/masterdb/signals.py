@@ -10,66 +10,166 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-from django.db.models.signals import pre_save
-from django.conf import settings
+from django.apps import apps
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from ensembl.production.masterdb.models import MasterBiotype
-from django.core.mail import send_mail
+from ensembl.production.masterdb import journal, notifications, search
+from ensembl.production.masterdb.fields import json_digest
+from ensembl.production.masterdb.cache import snapshots
+from ensembl.production.masterdb.models import MasterBiotype, MetaKey, WebData, TableVersion, VersionedModel, \
+    ChangeJournal, MasterAttribType, AnalysisDescription, tables_changed, rows_changed
+
+
+def biotype_update_message(instance: MasterBiotype, updated_fields):
+    """
+    Notification (editor, subject, body) about updated biotype fields.
+    :param instance: updated biotype
+    :param updated_fields: list of (field, old value, new value) as returned by `MasterBiotype.changed_fields`
+    """
+    return (
+        instance.modified_by,
+        '[Production MasterDB] Biotype updated !',
+        'MasterBioType %s (%s):' % (instance.name, instance.object_type) + "".join(
+            ["\n- %s: %s (initially:%s)" % (field, new, prev) for (field, prev, new) in updated_fields])
+    )
+
+
+def notify_biotype_update(instance: MasterBiotype, updated_fields):
+    """
+    Queue notification to `ensembl-production` mailing list about updated biotype fields, delivered
+    asynchronously (see `notifications.deliver`).
+    :param instance: updated biotype
+    :param updated_fields: list of (field, old value, new value) as returned by `MasterBiotype.changed_fields`
+    :return: None
+    """
+    notifications.enqueue(*biotype_update_message(instance, updated_fields))
 
 
 @receiver(pre_save, sender=MasterBiotype)
 def master_biotype_update(sender, instance: MasterBiotype, **kwargs):
     """
     Add signal to production DB app to automatically notify `ensembl-production` mailing list when someone update a biotype.
-    Triggered if one of these field is modified:
-    - misc_non_coding
-    - object_type
-    - biotype_group
-    - attrib_type
-    - db_type
-    - is_current
+    Triggered if one of `MasterBiotype.tracked_fields` is modified, compared with values loaded from database.
     :param instance: updated instance
     :param sender: object MasterBioType Model
     :param kwargs: dict Updates parameters
     :return: None
     """
-    watched_fields = [
-        'object_type',
-        'biotype_group',
-        'attrib_type',
-        'db_type',
-        'is_current',
-        'so_acc'
-    ]
-    updated_fields = []
     from_fixtures = kwargs.get('raw', False)
     created = instance.biotype_id is None
     if not (from_fixtures or created):
         # only trigger when this is no fixture load or new item
-        previous = MasterBiotype.objects.get(biotype_id=instance.biotype_id)
-        for field in watched_fields:
-            old_val = getattr(previous, field)
-            new_val = getattr(instance, field)
-            if isinstance(old_val, list):
-                if len(old_val) == 1:
-                    old_val = old_val[0]
-                else:
-                    old_val = set(sorted(old_val))
-            if isinstance(new_val, list):
-                if len(new_val) == 1:
-                    new_val = new_val[0]
-                else:
-                    new_val = set(sorted(new_val))
-            if old_val != new_val:
-                updated_fields += [(field, old_val, new_val)]
+        updated_fields = instance.changed_fields()
         if updated_fields:
-            #  send email to config email.
-            send_mail(
-                '[Production MasterDB] Biotype updated !',
-                '%s just modified important fields on MasterBioType table in production Master DB, please check '
-                'for:' % instance.modified_by + "".join(
-                    ["\n- %s: %s (initially:%s)" % (field, prev, new) for (field, prev, new) in updated_fields]),
-                getattr(settings, 'DEFAULT_FROM_EMAIL', 'me@localhost'),
-                [getattr(settings, 'MASTER_DB_ALERTS_EMAIL', 'me@localhost')],
-                fail_silently=settings.DEBUG
-            )
+            #  queue email to config email.
+            notify_biotype_update(instance, updated_fields)
+
+
+@receiver(pre_save, sender=WebData)
+def web_data_digest(sender, instance: WebData, raw=False, **kwargs):
+    """
+    Raw saves (i.e. fixtures loading) skip fields `pre_save`, compute data digest anyway.
+    """
+    if raw:
+        instance.data_digest = json_digest(instance.data) if instance.data is not None else None
+
+
+@receiver(post_save, sender=MasterBiotype)
+@receiver(post_save, sender=MetaKey)
+def sync_db_type_membership(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Keep indexed db_type membership in sync with `db_type` MultiSelectField, when it changed.
+    """
+    if created or raw or 'db_type' in [name for name, old_val, new_val in instance.changed_fields()]:
+        sender._meta.get_field('db_types').related_model.replace([instance])
+
+
+@receiver(tables_changed, sender=TableVersion)
+def invalidate_snapshots(sender, models=(), **kwargs):
+    """
+    Drop this process cached snapshots of changed tables, other processes see new table versions.
+    """
+    for model in models:
+        snapshots.invalidate(model)
+
+
+def index_saved(sender, instance, **kwargs):
+    search.index(sender, [instance.pk])
+
+
+def unindex_deleted(sender, instance, **kwargs):
+    search.unindex(sender, [instance.pk])
+
+
+def index_bulk_changes(sender, instances, **kwargs):
+    search.index(sender, [instance.pk for instance in instances])
+
+
+for model in search.SEARCH_FIELDS:
+    post_save.connect(index_saved, sender=model, dispatch_uid='index_saved_%s' % model.__name__)
+    post_delete.connect(unindex_deleted, sender=model, dispatch_uid='unindex_deleted_%s' % model.__name__)
+    rows_changed.connect(index_bulk_changes, sender=model, dispatch_uid='index_bulk_%s' % model.__name__)
+
+
+@receiver(post_save, sender=WebData)
+def index_web_data_analyses(sender, instance, created=False, **kwargs):
+    """
+    Analysis descriptions documents include their web data content.
+    """
+    if not created:
+        search.index(AnalysisDescription, instance.analysis.values_list('pk', flat=True))
+
+
+@receiver(rows_changed, sender=WebData)
+def index_bulk_web_data_analyses(sender, instances, **kwargs):
+    search.index(AnalysisDescription, AnalysisDescription.objects.filter(
+        web_data__in=[instance.pk for instance in instances]).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=WebData)
+def web_data_analyses(sender, instance, **kwargs):
+    # referencing analyses are set to NULL before post_delete
+    instance._analysis_pks = list(instance.analysis.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=WebData)
+def index_deleted_web_data_analyses(sender, instance, **kwargs):
+    search.index(AnalysisDescription, getattr(instance, '_analysis_pks', []))
+
+
+@receiver(post_save, sender=MasterAttribType)
+def index_attrib_type_biotypes(sender, instance, created=False, **kwargs):
+    """
+    Biotypes documents include their attrib type name.
+    """
+    if not created and 'name' in [name for name, old_val, new_val in instance.changed_fields()]:
+        search.index(MasterBiotype, instance.masterbiotype_set.values_list('pk', flat=True))
+
+
+def bump_table_version(sender, **kwargs):
+    """
+    Increment table version on each save / delete, invalidating API ETags computed from it.
+    """
+    TableVersion.objects.bump(sender)
+
+
+def journal_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        journal.record(sender, [instance], ChangeJournal.INSERT if created else ChangeJournal.UPDATE)
+
+
+def journal_deleted(sender, instance, **kwargs):
+    journal.record(sender, [instance], ChangeJournal.DELETE)
+
+
+def journal_bulk_changes(sender, instances, operation, **kwargs):
+    journal.record(sender, instances, operation)
+
+
+for model in apps.get_app_config('ensembl_production_db').get_models():
+    if issubclass(model, VersionedModel):
+        post_save.connect(bump_table_version, sender=model, dispatch_uid='bump_table_version_%s' % model.__name__)
+        post_delete.connect(bump_table_version, sender=model, dispatch_uid='bump_table_version_%s' % model.__name__)
+        post_save.connect(journal_saved, sender=model, dispatch_uid='journal_saved_%s' % model.__name__)
+        post_delete.connect(journal_deleted, sender=model, dispatch_uid='journal_deleted_%s' % model.__name__)
+        rows_changed.connect(journal_bulk_changes, sender=model, dispatch_uid='journal_bulk_%s' % model.__name__)
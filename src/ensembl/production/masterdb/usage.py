@@ -0,0 +1,159 @@
+#   See the NOTICE file distributed with this work for additional information
+#   regarding copyright ownership.
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Inverted usage index of master rows (biotypes, attrib types, external dbs) in target databases: number of
+referencing rows per (model, key, database), refreshed only for databases which tables changed since last scan.
+"""
+import hashlib
+
+from django.db import transaction
+
+from ensembl.production.masterdb.models import MasterAttribType, MasterBiotype, MasterExternalDb, UsageCount, \
+    UsageDatabase
+
+
+class UsageScan:
+    """
+    Rows of target `tables` referencing `model` primary key from `column`.
+    """
+
+    def __init__(self, model, tables, column):
+        self.model = model
+        self.tables = tables
+        self.column = column
+
+    @property
+    def name(self):
+        return self.model._meta.model_name
+
+    def master_keys(self):
+        """
+        :return: mapping of target values to master keys, None when target values are master primary keys
+        """
+        return None
+
+    def scan(self, cursor, quote, tables, keys):
+        """
+        One grouped query per present table.
+        :return: dict master key -> rows count
+        """
+        counts = {}
+        for table in self.tables:
+            if table not in tables:
+                continue
+            cursor.execute('SELECT %s, COUNT(*) FROM %s GROUP BY %s' % (quote(self.column), quote(table),
+                                                                        quote(self.column)))
+            for value, count in cursor.fetchall():
+                key = self.key(table, value, keys)
+                if key is not None:
+                    counts[key] = counts.get(key, 0) + count
+        return counts
+
+    def key(self, table, value, keys):
+        return value
+
+
+class BiotypeScan(UsageScan):
+    """
+    Genes and transcripts reference biotypes by name, matched on master (name, object_type).
+    """
+
+    def __init__(self):
+        super().__init__(MasterBiotype, ('gene', 'transcript'), 'biotype')
+
+    def master_keys(self):
+        return {(name, object_type): pk for pk, name, object_type in
+                MasterBiotype.objects.filter(is_current=True).values_list('pk', 'name', 'object_type')}
+
+    def key(self, table, value, keys):
+        return keys.get((value, table))
+
+
+USAGE_SCANS = (
+    BiotypeScan(),
+    UsageScan(MasterAttribType, ('gene_attrib', 'transcript_attrib', 'translation_attrib', 'seq_region_attrib',
+                                 'misc_attrib'), 'attrib_type_id'),
+    UsageScan(MasterExternalDb, ('xref',), 'external_db_id'),
+)
+
+SCANNED_TABLES = sorted({table for scan in USAGE_SCANS for table in scan.tables})
+
+
+def master_keys():
+    """
+    Master keys mappings of all scans, loaded once for all target databases.
+    """
+    return {scan.name: scan.master_keys() for scan in USAGE_SCANS}
+
+
+def master_digest(keys):
+    return hashlib.sha256(repr(sorted((name, sorted(mapping.items()) if mapping else None)
+                                      for name, mapping in keys.items())).encode()).hexdigest()
+
+
+def tables_checksum(connection, tables, salt=''):
+    """
+    Cheap checksum of scanned tables state: MySQL tables metadata (rows, last update time, live checksum when
+    enabled) or rows count and highest rowid for other backends.
+    Note: in-place updates changing none of these go unnoticed, e.g. on InnoDB tables which update time is not
+    persisted across server restarts, or on other backends: such databases are only rescanned with `--full`.
+    """
+    quote = connection.ops.quote_name
+    if not tables:
+        return hashlib.sha256(salt.encode()).hexdigest()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute('SELECT TABLE_NAME, TABLE_ROWS, UPDATE_TIME, CHECKSUM FROM information_schema.TABLES '
+                           'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN (%s) ORDER BY TABLE_NAME'
+                           % ', '.join(['%s'] * len(tables)), tables)
+            state = cursor.fetchall()
+        else:
+            state = []
+            for table in tables:
+                cursor.execute('SELECT COUNT(*), MAX(rowid) FROM %s' % quote(table))
+                state.append((table,) + tuple(cursor.fetchone()))
+    return hashlib.sha256((repr(state) + salt).encode()).hexdigest()
+
+
+def scan_usage(connection, keys, checksum=None):
+    """
+    Scan target database `connection`, unless its tables checksum is still `checksum`.
+    :return: (checksum, {model: {key: count}}), counts being None when unchanged
+    """
+    tables = sorted(set(connection.introspection.table_names()) & set(SCANNED_TABLES))
+    current = tables_checksum(connection, tables, salt=master_digest(keys))
+    if current == checksum:
+        return current, None
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        return current, {scan.name: scan.scan(cursor, quote, tables, keys[scan.name]) for scan in USAGE_SCANS}
+
+
+def store_usage(name, checksum, counts, batch_size=1000):
+    """
+    Replace database `name` usage counts.
+    """
+    with transaction.atomic():
+        database, created = UsageDatabase.objects.update_or_create(name=name, defaults={'checksum': checksum})
+        if not created:
+            database.counts.all().delete()
+        UsageCount.objects.bulk_create([UsageCount(database=database, model=model, key=key, count=count)
+                                        for model, model_counts in counts.items()
+                                        for key, count in model_counts.items()], batch_size=batch_size)
+
+
+def usage_of(instance):
+    """
+    Databases using master row `instance`, most used first.
+    """
+    return UsageCount.objects.filter(model=instance._meta.model_name, key=instance.pk).select_related(
+        'database').order_by('-count', 'database__name')
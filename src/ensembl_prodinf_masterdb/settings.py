@@ -10,6 +10,7 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import os
 from pathlib import Path
 
 DEBUG = True
@@ -73,6 +74,19 @@ DATABASES = {
     }
 }
 
+if os.getenv('DB') == 'mysql':
+    # e.g. CI job running the tests requiring row locks (select_for_update)
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.mysql',
+        'NAME': os.getenv('DB_NAME', 'ensembl_production_master'),
+        'USER': os.getenv('DB_USER', 'root'),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': os.getenv('DB_HOST', '127.0.0.1'),
+        'PORT': os.getenv('DB_PORT', '3306'),
+        'OPTIONS': {'charset': 'utf8mb4'},
+        'TEST': {'CHARSET': 'utf8mb4', 'COLLATION': 'utf8mb4_general_ci'},
+    }
+
 LANGUAGE_CODE = 'en-gb'
 
 TIME_ZONE = 'UTC'